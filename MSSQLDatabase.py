@@ -1,6 +1,9 @@
 import pyodbc
 from dotenv import load_dotenv
 import os
+import threading
+import time
+from collections import deque
 from contextlib import contextmanager
 
 class MSSQLDatabase:
@@ -47,22 +50,49 @@ class MSSQLDatabase:
             print(f"Error fetching results: {e}")
             raise
 
+    def iter_results(self, query, params=None, batch_size=500):
+        """
+        Generator version of fetch_results(): yields the rows one by one while
+        fetching them from the server in batches of `batch_size` (cursor.fetchmany).
+        Close the generator (or exhaust it) to release the cursor.
+        """
+        if self.connection is None:
+            raise Exception("Database connection is not established.")
+        try:
+            with self.connection.cursor() as cursor:
+                if params:
+                    cursor.execute(query, params)
+                else:
+                    cursor.execute(query)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield from rows
+        except pyodbc.Error as e:
+            print(f"Error fetching results: {e}")
+            raise
+
     def close(self):
         if self.connection:
             self.connection.close()
             print("Database connection closed.")
 
     @staticmethod
-    @contextmanager
-    def connect_with_env():
+    def _env_params():
         load_dotenv()  # Load environment variables from .env file
-        server = os.getenv("DB_SERVER")
-        database = os.getenv("DB_DATABASE")
-        username = os.getenv("DB_USERNAME")
-        password = os.getenv("DB_PASSWORD")
-        port = os.getenv("DB_PORT", 1433)
+        return (
+            os.getenv("DB_SERVER"),
+            os.getenv("DB_DATABASE"),
+            os.getenv("DB_USERNAME"),
+            os.getenv("DB_PASSWORD"),
+            os.getenv("DB_PORT", 1433),
+        )
 
-        db = MSSQLDatabase(server, database, username, password, port)
+    @staticmethod
+    @contextmanager
+    def connect_with_env():
+        db = MSSQLDatabase(*MSSQLDatabase._env_params())
         try:
             if db.connect():
                 yield db
@@ -71,6 +101,217 @@ class MSSQLDatabase:
         finally:
             db.close()
 
+    @staticmethod
+    @contextmanager
+    def pooled_with_env():
+        """
+        Like connect_with_env(), but borrows the connection from the process wide
+        pool instead of doing a fresh ODBC login on every call.
+        """
+        with MSSQLConnectionPool.default().connection() as db:
+            yield db
+
+
+class PooledMSSQLDatabase(MSSQLDatabase):
+    """
+    MSSQLDatabase whose connection is borrowed from a MSSQLConnectionPool.
+    close() hands the connection back to the pool instead of closing it.
+    """
+    def __init__(self, pool, connection):
+        self.connection_string = pool.connection_string
+        self.connection = connection
+        self._pool = pool
+        self._broken = False
+
+    def connect(self):
+        return self.connection is not None
+
+    def fetch_results(self, query, params=None):
+        try:
+            return super().fetch_results(query, params)
+        except pyodbc.Error:
+            self._broken = True
+            raise
+
+    def execute_query(self, query, params=None):
+        try:
+            return super().execute_query(query, params)
+        except pyodbc.Error:
+            self._broken = True
+            raise
+
+    def iter_results(self, query, params=None, batch_size=500):
+        try:
+            yield from super().iter_results(query, params, batch_size)
+        except pyodbc.Error:
+            self._broken = True
+            raise
+
+    def close(self):
+        if self.connection is not None:
+            self._pool.release(self.connection, broken=self._broken)
+            self.connection = None
+
+
+class PoolTimeoutError(Exception): pass
+
+
+class MSSQLConnectionPool:
+    """
+    Bounded, thread safe pool of pyodbc connections.
+
+    - at most `max_size` connections are open at the same time
+    - idle connections older than `idle_timeout` seconds are closed on checkout
+    - every reused connection is checked with `SELECT 1` before it is handed out
+    - stats() returns hit / miss / wait counters
+    """
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, connection_string, max_size=4, idle_timeout=300.0, checkout_timeout=30.0):
+        self.connection_string = connection_string
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+
+        self._idle = deque()  # (connection, last_used)
+        self._size = 0        # open connections, idle + borrowed
+        self._cond = threading.Condition()
+
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.discarded = 0
+
+    @classmethod
+    def from_env(cls, **kw):
+        server, database, username, password, port = MSSQLDatabase._env_params()
+        return cls(MSSQLDatabase(server, database, username, password, port).connection_string, **kw)
+
+    @classmethod
+    def default(cls):
+        """Return the lazily created process wide pool configured from .env"""
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls.from_env(
+                    max_size=int(os.getenv("DB_POOL_SIZE", 4)),
+                    idle_timeout=float(os.getenv("DB_POOL_IDLE_TIMEOUT", 300)),
+                )
+            return cls._default
+
+    # ---------- checkout / checkin ----------
+    def acquire(self, timeout=None):
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        waited = False
+
+        while True:
+            with self._cond:
+                while True:
+                    if self._idle:
+                        # still counted in _size, so nobody else can open a connection in its place
+                        conn, last_used = self._idle.pop()
+                        break
+
+                    if self._size < self.max_size:
+                        self._size += 1
+                        self.misses += 1
+                        conn = None
+                        break
+
+                    if not waited:
+                        self.waits += 1
+                        waited = True
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeoutError(f"No database connection available after {timeout}s")
+                    self._cond.wait(remaining)
+
+            if conn is None:
+                break
+
+            # the liveness check is a round trip to the server, never hold the lock for it
+            if time.monotonic() - last_used > self.idle_timeout or not self._is_alive(conn):
+                self._discard(conn)
+                continue
+            with self._cond:
+                self.hits += 1
+            return conn
+
+        # connect outside of the lock, the login is the slow part
+        try:
+            conn = pyodbc.connect(self.connection_string)
+            print("Connection to MSSQL database successful (pooled).")
+            return conn
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn, broken=False):
+        if broken:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        db = PooledMSSQLDatabase(self, self.acquire(timeout))
+        try:
+            yield db
+        except pyodbc.Error:
+            db._broken = True
+            raise
+        finally:
+            db.close()
+
+    # ---------- maintenance ----------
+    def close_all(self):
+        """Close all idle connections, borrowed ones are closed on release."""
+        with self._cond:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+        for conn in idle:
+            self._discard(conn)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "hits": self.hits,
+                "misses": self.misses,
+                "waits": self.waits,
+                "discarded": self.discarded,
+            }
+
+    def _discard(self, conn):
+        # must be called without self._cond held, close() may block on the network
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self.discarded += 1
+            self._cond.notify()
+
+    @staticmethod
+    def _is_alive(conn) -> bool:
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+            finally:
+                cursor.close()
+            return True
+        except Exception:
+            return False
+
 # Example usage:
 # Create a .env file with the following content:
 # DB_SERVER=your_server
@@ -78,10 +319,17 @@ class MSSQLDatabase:
 # DB_USERNAME=your_username
 # DB_PASSWORD=your_password
 # DB_PORT=1433
+# DB_POOL_SIZE=4            (optional)
+# DB_POOL_IDLE_TIMEOUT=300  (optional, seconds)
 
 # Usage:
 # with MSSQLDatabase.connect_with_env() as db:
 #     db.execute_query("CREATE TABLE TestTable (id INT, name NVARCHAR(50))")
 #     db.execute_query("INSERT INTO TestTable (id, name) VALUES (?, ?)", (1, 'John Doe'))
 #     results = db.fetch_results("SELECT * FROM TestTable")
-#     print(results)
\ No newline at end of file
+#     print(results)
+
+# Pooled usage (connection is reused between calls):
+# with MSSQLDatabase.pooled_with_env() as db:
+#     results = db.fetch_results("SELECT * FROM TestTable")
+# print(MSSQLConnectionPool.default().stats())
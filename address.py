@@ -0,0 +1,74 @@
+# address.py
+# Structured receiver address, shared by the JTL import, the UI and the DHL checkout.
+from typing import NamedTuple
+
+
+class Address(NamedTuple):
+    """
+    Receiver address in the fields of a DHL Internetmarke position.
+    Same order as dhl_api.struct_address() returns them, so it unpacks the same way.
+    """
+    name: str = ""
+    additional_name: str = ""
+    street: str = ""
+    street2: str = ""
+    postalcode: str = ""
+    city: str = ""
+    country: str = ""
+
+    @property
+    def text(self) -> str:
+        """Address block as shown in the UI and printed on the label."""
+        lines = (
+            self.name, self.additional_name, self.street, self.street2,
+            f"{self.postalcode} {self.city}".strip(), self.country,
+        )
+        return "\n".join(line for line in lines if line)
+
+
+_JTL_WIDTH = 8
+_join_lines = "\n".join
+_join_words = " ".join
+_make_address = Address._make
+
+
+def _clean_fields(fields) -> tuple:
+    """Slow path for odd rows: pad / cut to 8 fields, everything that is not text becomes text or ''."""
+    fields = (tuple(fields) + (None,) * _JTL_WIDTH)[:_JTL_WIDTH]
+    return tuple("" if v is None else str(v) for v in fields)
+
+
+def format_jtl_fields(field_rows) -> tuple[list[str], list[Address]]:
+    """
+    Format a whole batch of JTL address columns (company, title, last, first, street, postal,
+    city, country) in one pass. Every field is stripped once, NULLs (LEFT JOIN without
+    tAdresse) become '' and a malformed row does not stop the batch.
+
+    :return: (display texts, Address records), one entry per row
+    """
+    texts = []
+    addresses = []
+    add_text = texts.append
+    add_address = addresses.append
+    for fields in field_rows:
+        try:
+            c, t, l, f, st, pc, ci, co = fields
+            c = c.strip() if c else ""
+            t = t.strip() if t else ""
+            l = l.strip() if l else ""
+            f = f.strip() if f else ""
+            st = st.strip() if st else ""
+            pc = pc.strip() if pc else ""
+            ci = ci.strip() if ci else ""
+            co = co.strip() if co else ""
+        except (AttributeError, TypeError, ValueError):
+            c, t, l, f, st, pc, ci, co = (v.strip() for v in _clean_fields(fields))
+
+        # person line (first + title + last, skipping empties)
+        person = _join_words(filter(None, (f, t, l)))
+        name, additional = (c, person) if c else (person, "")
+        place = f"{pc} {ci}" if pc and ci else (pc or ci)
+
+        add_address(_make_address((name, additional, st, "", pc, ci, co)))
+        add_text(_join_lines(filter(None, (name, additional, st, place, co))))
+    return texts, addresses
@@ -0,0 +1,66 @@
+# bench_struct_address.py
+# Micro benchmark of dhl_api.struct_address / struct_addresses.
+#   python bench_struct_address.py [count] [distinct]
+import random
+import sys
+import time
+
+from dhl_api import _normalize_address, _parse_address, struct_address, struct_addresses
+
+STREETS = ["Bachstraße", "Hauptstraße", "Am Markt", "Keizersgracht", "ul. Długa", "Downing Street", "Storgatan"]
+CITIES = [
+    ("{:05d}", "Stettfeld", "Deutschland"), ("{:04d}", "Wien", "Österreich"),
+    ("{:04d} AB", "Amsterdam", "Niederlande"), ("00-{:03d}", "Warszawa", "Polen"),
+    ("SW{:d} 2AA", "London", "Vereinigtes Königreich"), ("114 {:02d}", "Stockholm", "Schweden"),
+]
+
+
+def make_address(rng: random.Random) -> str:
+    """An address shaped like the ones formatted by jtl_api._format_address."""
+    postal, city, country = rng.choice(CITIES)
+    lines = [f"{rng.choice(['Anna', 'Jan', 'Maria', 'John'])} {rng.choice(['Huber', 'de Vries', 'Nowak', 'Smith'])}"]
+    if rng.random() < 0.3:
+        lines.append(rng.choice(["frapp GmbH", "Einkauf", "c/o Müller"]))
+    lines.append(f"{rng.choice(STREETS)} {rng.randint(1, 200)}")
+    if rng.random() < 0.1:
+        lines.append(f"Postfach {rng.randint(1, 99)}")
+    lines.append(f"{postal.format(rng.randint(1, 99))} {city}")
+    lines.append(country)
+    return "\n".join(lines)
+
+
+def bench(name, fn, repeat=3):
+    best = min(_timed(fn) for _ in range(repeat))
+    print(f"{name:<34} {best * 1000:8.1f} ms")
+    return best
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    distinct = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    rng = random.Random(42)
+    pool = [make_address(rng) for _ in range(distinct)]
+    addresses = [rng.choice(pool) for _ in range(count)]
+    print(f"{count} addresses, {distinct} distinct")
+
+    uncached = _parse_address.__wrapped__
+    base = bench("uncached, one by one", lambda: [uncached(_normalize_address(a)) for a in addresses])
+
+    def cold_batch():
+        _parse_address.cache_clear()
+        struct_addresses(addresses)
+    batch = bench("struct_addresses (cold cache)", cold_batch)
+
+    struct_addresses(addresses)
+    single = bench("struct_address (warm cache)", lambda: [struct_address(a) for a in addresses])
+    print(f"speedup batch {base / batch:.1f}x, warm {base / single:.1f}x, {_parse_address.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
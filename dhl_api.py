@@ -1,42 +1,252 @@
-import http.client
-import json
-import urllib.parse
 import os
-import json
 import fitz  # PyMuPDF
 import base64
 import requests
+from requests.adapters import HTTPAdapter
 import zipfile
 import io
+import tempfile
+import threading
+import time
 from PIL import Image  # optional, if you want to load the PNGs
 
-from dotenv import load_dotenv
+from address import Address
+from dhl_resilience import ENDPOINT_TIMEOUTS, RETRY_STATUS, CircuitBreaker, RetryPolicy
 
-BEARER_TOKEN = ''
+from dotenv import load_dotenv
 
 DHL_USERNAME = os.getenv('DHL_USERNAME')
 DHL_PASSWORD = os.getenv('DHL_PASSWORD')
 DHL_CLIENT_ID = os.getenv('DHL_CLIENT_ID')
 DHL_CLIENT_SECRET = os.getenv('DHL_CLIENT_SECRET')
 
+DHL_BASE_URL = "https://api-eu.dhl.com/post/de/shipping/im/v1"
+
+
+class DHLClient:
+    """
+    Keep-alive HTTP client for the Internetmarke API.
+
+    All calls (token, cart, checkout, ZIP download) share one requests.Session,
+    so the TCP / TLS connection to api-eu.dhl.com is reused between them.
+    Every call is timed, see metrics().
+
+    Each endpoint has its own timeout (dhl_resilience.ENDPOINT_TIMEOUTS),
+    idempotent calls are retried with jittered backoff on connection errors and
+    5xx / 429 responses, and a circuit breaker fails fast while the API is down.
+    """
+    def __init__(self, base_url=None, timeout=(5, 30), pool_maxsize=4, retry=None, breaker=None):
+        self.base_url = base_url
+        self.timeout = timeout  # default (connect, read) seconds
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._metrics = {}  # endpoint -> {calls, errors, retries, total_s, last_s, max_s}
+        self._metrics_lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        # DHL_API_BASE_URL is read on use, the .env file is loaded after this module is imported
+        return self._base_url or os.getenv('DHL_API_BASE_URL') or DHL_BASE_URL
+
+    @base_url.setter
+    def base_url(self, value):
+        """None falls back to DHL_API_BASE_URL / DHL_BASE_URL."""
+        self._base_url = value.rstrip('/') if value else None
+
+    def url(self, path):
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return self.base_url.rstrip('/') + path
+
+    def request(self, method, path, endpoint=None, idempotent=None, use_breaker=True, **kwargs) -> requests.Response:
+        """
+        Send a request relative to base_url (absolute urls are used as they are).
+        `endpoint` names the call in the metrics and picks its timeout, defaults to the path.
+        `idempotent` defaults to True for GET / HEAD, only idempotent calls are retried.
+        `use_breaker=False` sends the call even if the circuit is open and leaves the breaker
+        untouched, for calls which must not be skipped (see resume_checkout()).
+        """
+        endpoint = endpoint or path
+        kwargs.setdefault("timeout", ENDPOINT_TIMEOUTS.get(endpoint, self.timeout))
+        if idempotent is None:
+            idempotent = method.upper() in ("GET", "HEAD")
+        retries = self.retry.retries if idempotent else 0
+
+        attempt = 0
+        while True:
+            if use_breaker:
+                self.breaker.before_call()
+            start = time.perf_counter()
+            response = None
+            try:
+                response = self.session.request(method, self.url(path), **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self._record(endpoint, time.perf_counter() - start, False)
+                if use_breaker:
+                    self.breaker.record_failure()
+                if attempt >= retries:
+                    raise
+            else:
+                failed = response.status_code in RETRY_STATUS
+                self._record(endpoint, time.perf_counter() - start, not failed)
+                if use_breaker:
+                    if failed:
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.record_success()
+                if not failed:
+                    return response
+                if attempt >= retries:
+                    return response
+                response.close()
+
+            self._count(endpoint, "retries")
+            self.retry.wait(attempt, response)
+            attempt += 1
+
+    def metrics(self) -> dict:
+        with self._metrics_lock:
+            metrics = {name: dict(m) for name, m in self._metrics.items()}
+        metrics["circuit"] = self.breaker.stats()
+        return metrics
+
+    def close(self):
+        self.session.close()
+
+    def _entry(self, endpoint):
+        return self._metrics.setdefault(endpoint, {
+            "calls": 0, "errors": 0, "retries": 0, "resumed": 0, "total_s": 0.0, "last_s": 0.0, "max_s": 0.0,
+        })
+
+    def _count(self, endpoint, counter):
+        with self._metrics_lock:
+            self._entry(endpoint)[counter] += 1
+
+    def _record(self, endpoint, seconds, ok):
+        with self._metrics_lock:
+            m = self._entry(endpoint)
+            m["calls"] += 1
+            m["errors"] += 0 if ok else 1
+            m["total_s"] += seconds
+            m["last_s"] = seconds
+            m["max_s"] = max(m["max_s"], seconds)
+
+
+client = DHLClient()
+
+
 def api_version_resource():
-    conn = http.client.HTTPSConnection("api-eu.dhl.com")
-    payload = ''
-    headers = {}
     try:
-        conn.request("GET", "/post/de/shipping/im/v1/", payload, headers)
-        res = conn.getresponse()
-        data = res.read()
+        client.request("GET", "/", endpoint="version")
         return True
     except:
         return False
 
+def _request_user():
+    """POST /user, returns the decoded response (access_token, walletBalance, expires_in, ...)."""
+    DHL_USERNAME = os.getenv('DHL_USERNAME')
+    DHL_PASSWORD = os.getenv('DHL_PASSWORD')
+    DHL_CLIENT_ID = os.getenv('DHL_CLIENT_ID')
+    DHL_CLIENT_SECRET = os.getenv('DHL_CLIENT_SECRET')
+
+    payload = {
+        'grant_type': 'client_credentials',
+        'username': DHL_USERNAME,        # Replace with your Internetmarke username
+        'password': DHL_PASSWORD,          # Replace with your Internetmarke password
+        'client_id': DHL_CLIENT_ID,   # Replace with your client_id
+        'client_secret': DHL_CLIENT_SECRET # Replace with your client_secret
+    }
+    # form encoded (application/x-www-form-urlencoded)
+    res = client.request("POST", "/user", endpoint="user", idempotent=True, data=payload)
+
+    # Convert JSON string to Python dict
+    return res.json()
+
+
+class DHLTokenManager:
+    """
+    Caches the Internetmarke bearer token until it expires.
+
+    token() only authenticates when there is no valid token. After every
+    authentication a background timer refreshes the token `refresh_margin`
+    seconds before `expires_in` runs out, so purchases never wait for POST /user.
+    """
+    def __init__(self, refresh_margin=120, request_user=None):
+        self.refresh_margin = refresh_margin
+        self._request_user = request_user or _request_user
+        self._lock = threading.Lock()
+        self._data = None        # last /user response
+        self._expires_at = 0.0   # time.monotonic() based
+        self._timer = None
+
+    def token(self) -> str:
+        """Return a valid bearer token, authenticate if needed."""
+        with self._lock:
+            if self._data is None or time.monotonic() >= self._expires_at:
+                self._refresh_locked()
+            return self._data['access_token']
+
+    def refresh(self) -> dict:
+        """Authenticate now (e.g. to read the current walletBalance) and return the /user response."""
+        with self._lock:
+            self._refresh_locked()
+            return self._data
+
+    def invalidate(self):
+        """Forget the token, e.g. after a 401 response."""
+        with self._lock:
+            self._data = None
+            self._expires_at = 0.0
+            self._cancel_timer()
+
+    def seconds_left(self) -> float:
+        return max(0.0, self._expires_at - time.monotonic())
+
+    def _refresh_locked(self):
+        data = self._request_user()
+        self._data = data
+        self._expires_at = time.monotonic() + float(data.get('expires_in', 0))
+        self._schedule_refresh(float(data.get('expires_in', 0)))
+
+    def _schedule_refresh(self, expires_in):
+        self._cancel_timer()
+        delay = expires_in - self.refresh_margin
+        if delay <= 0:
+            return
+        self._timer = threading.Timer(delay, self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            # the next token() call authenticates again once the token expired
+            print(f"DHL token refresh failed: {e}")
+
+
+token_manager = DHLTokenManager()
+
+
 def user_resource():
     """
     Authenticate with DHL Internetmarke API and retrieve user details.
 
     This function requests an access token and related account information
     from DHL's Internetmarke API using credentials stored in environment variables.
+    The token is stored in `token_manager` and reused by the other API calls
+    until it expires.
 
     Returns:
         tuple: A tuple containing the following values:
@@ -54,31 +264,7 @@ def user_resource():
         >>> print("Wallet balance:", walletBalance)
         >>> print("Authenticated user:", authenticated_user)
     """
-    DHL_USERNAME = os.getenv('DHL_USERNAME')
-    DHL_PASSWORD = os.getenv('DHL_PASSWORD')
-    DHL_CLIENT_ID = os.getenv('DHL_CLIENT_ID')
-    DHL_CLIENT_SECRET = os.getenv('DHL_CLIENT_SECRET')
-
-    conn = http.client.HTTPSConnection("api-eu.dhl.com")
-    payload = urllib.parse.urlencode({
-        'grant_type': 'client_credentials',
-        'username': DHL_USERNAME,        # Replace with your Internetmarke username
-        'password': DHL_PASSWORD,          # Replace with your Internetmarke password
-        'client_id': DHL_CLIENT_ID,   # Replace with your client_id
-        'client_secret': DHL_CLIENT_SECRET # Replace with your client_secret
-    })
-    headers = {
-    'content-type': 'application/x-www-form-urlencoded',
-    }
-    conn.request("POST", "/post/de/shipping/im/v1/user", payload, headers)
-    res = conn.getresponse()
-    response_str = res.read()
-
-    # Convert JSON string to Python dict
-    data = json.loads(response_str)
-    # load access token
-    global BEARER_TOKEN
-    BEARER_TOKEN = data['access_token']
+    data = token_manager.refresh()
 
     return (
         data['access_token'], 
@@ -90,29 +276,40 @@ def user_resource():
         data["authenticated_user"]
     )
 
-def get_shopping_chart_id():
-
-    conn = http.client.HTTPSConnection("api-eu.dhl.com")
-    payload = ''
-    headers = {
-    'Authorization': 'Bearer {}'.format(BEARER_TOKEN),
-    'Content-Length': '0'
-    }
-    conn.request("POST", "/post/de/shipping/im/v1/app/shoppingcart", payload, headers)
-    res = conn.getresponse()
-    data = res.read()
+def _auth_headers():
+    return {'Authorization': 'Bearer {}'.format(token_manager.token())}
 
-    response = data.decode("utf-8")
-    return json.loads(response)['shopOrderId']
+def get_shopping_chart_id():
+    # an unused cart costs nothing, so creating one may be retried
+    res = client.request("POST", "/app/shoppingcart", endpoint="shoppingcart", idempotent=True, headers=_auth_headers())
+    return res.json()['shopOrderId']
+
+def get_shopping_chart(order_id, use_breaker=True):
+    """GET /app/shoppingcart/{shopOrderId}, the order with its download link once it is checked out."""
+    res = client.request("GET", f"/app/shoppingcart/{order_id}", endpoint="shoppingcart/get",
+                         use_breaker=use_breaker, headers=_auth_headers())
+    if res.status_code == 404:
+        return None
+    res.raise_for_status()
+    return res.json()
+
+def resume_checkout(order_id):
+    """
+    Find out whether a checkout whose response got lost went through.
+    Returns the order (with 'link') if it was paid, None if the cart is still open.
+    Sent past the circuit breaker: the failed checkout has just opened it, but whether
+    the wallet was charged must still be asked.
+    """
+    order = get_shopping_chart(order_id, use_breaker=False)
+    if order and order.get('link'):
+        client._count("shoppingcart/png", "resumed")
+        return order
+    return None
 
 
 
 def get_shopping_chart_pdf(order_id):
-    import http.client
-    import json
-
-    conn = http.client.HTTPSConnection("api-eu.dhl.com")
-    payload = json.dumps({
+    payload = {
     "type": "AppShoppingCartPDFRequest",
     "shopOrderId": order_id,
     "total": 270,
@@ -154,25 +351,29 @@ def get_shopping_chart_pdf(order_id):
         }
         }
     ]
-    })
-    headers = {
-        'content-type': 'application/json',
-        'Authorization': 'Bearer {}'.format(BEARER_TOKEN),
     }
-    conn.request("POST", "/post/de/shipping/im/v1/app/shoppingcart/pdf", payload, headers)
-    res = conn.getresponse()
-    data = res.read()
-    print(data.decode("utf-8"))
+    res = client.request("POST", "/app/shoppingcart/pdf", endpoint="shoppingcart/pdf", json=payload, headers=_auth_headers())
+    print(res.text)
+
+def _position_addresses(positions) -> list[Address]:
+    """Structured receiver of every position, the text is only parsed for positions without 'address'."""
+    parsed = iter(struct_addresses(e['receiver'] for e in positions if not e.get('address')))
+    return [e.get('address') or next(parsed) for e in positions]
 
 def checkout_shopping_chart_png(order_id, positions):
+    """
+    Check out the cart with one PNG postmark per position
+    ({receiver: text, product_code, price, address: Address (optional)}).
+    `address` is sent as it is, without it the receiver text is parsed with struct_address().
+    """
 
     price_total = 0
     for p in positions:
         price_total = price_total + p['price']
 
-    def build_positions(text, product_code, price):
+    def build_positions(fields, product_code, price):
 
-        name, addiditional_name, street, street2, postalcode, city, country = struct_address(text)
+        name, addiditional_name, street, street2, postalcode, city, country = fields
         
         if country.upper() == 'DEUTSCHLAND':
             country = 'DEU'
@@ -204,10 +405,7 @@ def checkout_shopping_chart_png(order_id, positions):
             "positionType": "AppShoppingCartPosition"
         }
 
-    # create connections
-    conn = http.client.HTTPSConnection("api-eu.dhl.com")
-
-    payload = json.dumps({
+    payload = {
         "type": "AppShoppingCartPNGRequest",
         "shopOrderId": order_id,
         "total": price_total,
@@ -216,50 +414,81 @@ def checkout_shopping_chart_png(order_id, positions):
 
         "dpi": "DPI300",
         "optimizePNG": True,
-        "positions": list(map(lambda e: build_positions(e['receiver'], e['product_code'], e['price']), positions))
+        "positions": [
+            build_positions(fields, e['product_code'], e['price'])
+            for e, fields in zip(positions, _position_addresses(positions))
+        ]
           
-    })
+    }
     # print(payload)
     
-    headers = {
-        'content-type': 'application/json',
-        'Authorization': 'Bearer {}'.format(BEARER_TOKEN),
-    }
-    conn.request("POST", "/post/de/shipping/im/v1/app/shoppingcart/png", payload, headers)
-    res = conn.getresponse()
-    response_string = res.read().decode('utf-8')
-
-    data = json.loads(response_string)
-    return data
+    # never retried: a lost response may still have charged the wallet, ask DHL for the order instead
+    try:
+        res = client.request("POST", "/app/shoppingcart/png", endpoint="shoppingcart/png", json=payload, headers=_auth_headers())
+    except (requests.ConnectionError, requests.Timeout) as e:
+        return _resume_or_raise(order_id, e)
+    if res.status_code >= 500:
+        return _resume_or_raise(order_id, f"HTTP {res.status_code}")
+    return res.json()
+
+class CheckoutError(Exception):
+    """
+    A checkout failed. `possibly_charged` is True when DHL could not be asked whether
+    it went through, the order `shop_order_id` must then be checked before buying again.
+    """
+    def __init__(self, message, shop_order_id, possibly_charged):
+        super().__init__(message)
+        self.shop_order_id = shop_order_id
+        self.possibly_charged = possibly_charged
 
 
+def _resume_or_raise(order_id, error):
+    try:
+        order = resume_checkout(order_id)
+    except Exception as e:
+        raise CheckoutError(
+            f"Checkout von Warenkorb {order_id} fehlgeschlagen ({error}) und nicht überprüfbar ({e}), "
+            f"möglicherweise wurde trotzdem gekauft - bitte im Portokasse-Konto prüfen",
+            order_id, possibly_charged=True,
+        ) from e
+    if order is None:
+        raise CheckoutError(
+            f"Checkout von Warenkorb {order_id} fehlgeschlagen ({error}), es wurde nichts gekauft",
+            order_id, possibly_charged=False,
+        )
+    print(f"Checkout von Warenkorb {order_id} nach Fehler ({error}) wieder aufgenommen")
+    return order
 
-def download_and_unpack(download_url):
-    images = []
 
-    # Step 1: Download the zip file
-    response = requests.get(download_url)
-    response.raise_for_status()
 
-    # Step 2: Open zip in memory
-    with zipfile.ZipFile(io.BytesIO(response.content)) as z:
-        # Step 3: Iterate over PNG files
-        for name in z.namelist():
-            if name.lower().endswith(".png"):
-                # Get file as a bytes-like object (blob)
-                with z.open(name) as file:
-                    blob = file.read()  # raw bytes
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_SPOOL_SIZE = 8 * 1024 * 1024  # ZIPs up to this size stay in memory, larger ones go to a temp file
 
-                    # Example 1: Work with raw bytes
-                    print(f"{name} → {len(blob)} bytes")
 
-                    # Example 2 (optional): Load directly into PIL without saving
-                    image = Image.open(io.BytesIO(blob))
-                    print(f"  Image size: {image.size}, format: {image.format}")
+def download_postmarks(download_url) -> list[tuple[str, bytes]]:
+    """
+    Download the postmark ZIP and return (entry name, raw PNG bytes) in ZIP order.
 
-                    images.append(image)
+    The response is streamed in chunks into a spooled temp file, the PNGs are
+    passed on as they are (no decode / re-encode).
+    """
+    postmarks = []
+    with client.request("GET", download_url, endpoint="download", stream=True) as response:
+        response.raise_for_status()
+        with tempfile.SpooledTemporaryFile(max_size=DOWNLOAD_SPOOL_SIZE) as spool:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                spool.write(chunk)
+            spool.seek(0)
+
+            with zipfile.ZipFile(spool) as z:
+                for info in z.infolist():
+                    if info.filename.lower().endswith(".png"):
+                        postmarks.append((info.filename, z.read(info)))
+    return postmarks
 
-    return images
+def download_and_unpack(download_url):
+    """Postmarks of the ZIP as PIL images, see download_postmarks() for the raw PNG bytes."""
+    return [Image.open(io.BytesIO(blob)) for _, blob in download_postmarks(download_url)]
 
 def mm_to_pt(mm: float) -> float:
     """Umrechnung Millimeter -> PDF-Punkte"""
@@ -300,37 +529,65 @@ def snip_pdf_region_mm_to_b64(pdf_path: str,
 
 
 import re
+from functools import lru_cache
+
+_HAS_DIGIT = re.compile(r"\d")
+
+# postal code + city (or city + postal code) line, first match wins:
+# (pattern, group of the postal code, group of the city)
+_POSTAL_CITY_PATTERNS = [
+    # NL 1234 AB Amsterdam, before the generic pattern which would take "AB" as part of the city
+    (re.compile(r"^(\d{4}\s?[A-Z]{2})\s+(.+)$"), 1, 2),
+    # DE / AT / CH / FR / IT / ES / DK / BE ..., optional country prefix (D-96188, CH-8001)
+    (re.compile(r"^(?:[A-Z]{1,3}-)?(\d{4,5})\s+(.+)$"), 1, 2),
+    # PL 00-950, PT 1000-001
+    (re.compile(r"^(\d{2}-\d{3}|\d{4}-\d{3})\s+(.+)$"), 1, 2),
+    # SE / CZ / SK / GR 123 45
+    (re.compile(r"^(\d{3}\s\d{2})\s+(.+)$"), 1, 2),
+    # UK SW1A 1AA London / London SW1A 1AA
+    (re.compile(r"^([A-Z]{1,2}\d[A-Z\d]?\s?\d[A-Z]{2})\s+(.+)$"), 1, 2),
+    (re.compile(r"^(.+?)\s+([A-Z]{1,2}\d[A-Z\d]?\s?\d[A-Z]{2})$"), 2, 1),
+]
+
+
+def _match_postal_city(line):
+    for pattern, postal_group, city_group in _POSTAL_CITY_PATTERNS:
+        m = pattern.match(line)
+        if m:
+            return m.group(postal_group), m.group(city_group)
+    return None
+
+
+def _normalize_address(address: str) -> str:
+    return "\n".join(l.strip() for l in address.strip().splitlines() if l.strip())
+
+
+@lru_cache(maxsize=4096)
+def _parse_address(normalized: str):
+    lines = normalized.split("\n") if normalized else []
 
-def struct_address(address: str):
-    """
-    Parse a postal address string into components:
-    name, additional_name, street, street2, postal code, city, country
-    """
-    # Normalize and split into lines
-    lines = [l.strip() for l in address.strip().splitlines() if l.strip()]
-    
     # Defaults
     name = additional_name = street = street2 = postalcode = city = country = ""
-    
+
     if lines:
         name = lines[0]
-    
+
     # Handle optional second line as "additional name" (e.g., department, c/o)
     i = 1
-    if i < len(lines) and not re.search(r"\d", lines[i]):
+    if i < len(lines) and not _HAS_DIGIT.search(lines[i]):
         additional_name = lines[i]
         i += 1
-    
+
     # Next line is usually street
     if i < len(lines):
         street = lines[i]
         i += 1
-    
-       # Check if next line looks like a postal code + city
+
+    # Check if next line looks like a postal code + city
     if i < len(lines):
-        m = re.match(r"(\d{4,5})\s+(.+)", lines[i])
+        m = _match_postal_city(lines[i])
         if m:
-            postalcode, city = m.groups()
+            postalcode, city = m
             i += 1
         else:
             # If not a postal code → treat as street2
@@ -338,21 +595,41 @@ def struct_address(address: str):
             i += 1
             # Try postal code on next line
             if i < len(lines):
-                m = re.match(r"(\d{4,5})\s+(.+)", lines[i])
+                m = _match_postal_city(lines[i])
                 if m:
-                    postalcode, city = m.groups()
-                    i += 1
+                    postalcode, city = m
                 else:
                     city = lines[i]
-                    i += 1
-    
-    # Remaining line(s) → country or street2
+                i += 1
+
+    # Remaining line(s) → country
     if i < len(lines):
         country = lines[i]
-        i += 1
-   
-    
-    return name, additional_name, street, street2, postalcode, city, country
+
+    return Address(name, additional_name, street, street2, postalcode, city, country)
+
+
+def struct_address(address: str) -> Address:
+    """
+    Parse a postal address string into components:
+    name, additional_name, street, street2, postal code, city, country
+
+    Results are cached by the normalized text (stripped, without empty lines).
+    """
+    return _parse_address(_normalize_address(address))
+
+
+def struct_addresses(addresses) -> list[Address]:
+    """struct_address() for a batch of addresses, duplicates are parsed once."""
+    parsed = {}
+    result = []
+    for address in addresses:
+        normalized = _normalize_address(address)
+        fields = parsed.get(normalized)
+        if fields is None:
+            fields = parsed[normalized] = _parse_address(normalized)
+        result.append(fields)
+    return result
 
 
 def main():
@@ -369,7 +646,7 @@ def main():
 
     # buy shopping chart
     response = checkout_shopping_chart_png(shop_order_id, [])
-    images = download_and_unpack(response['link'], )
+    postmarks = download_postmarks(response['link'])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
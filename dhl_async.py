@@ -0,0 +1,103 @@
+# dhl_async.py
+# asyncio counterpart of dhl_api. The blocking calls of the shared keep-alive
+# client run in worker threads (asyncio.to_thread), a semaphore keeps the number
+# of requests in flight below DHL's rate limits.
+import asyncio
+import threading
+
+import dhl_api
+
+
+class AsyncDHLClient:
+    """
+    Usage (inside a coroutine):
+        dhl = AsyncDHLClient(max_concurrency=4)
+        ok, user = await dhl.health_check()
+        results = await dhl.checkout_carts([positions_a, positions_b])
+    """
+    def __init__(self, max_concurrency=4):
+        self.max_concurrency = max_concurrency
+        self._semaphores = {}  # event loop -> Semaphore, a semaphore is bound to one loop
+
+    async def _call(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        async with semaphore:
+            return await asyncio.to_thread(fn, *args)
+
+    # ---------- single calls ----------
+    async def api_version(self) -> bool:
+        return await self._call(dhl_api.api_version_resource)
+
+    async def user(self) -> dict:
+        """Authenticate now, returns the /user response (walletBalance, issued_at, ...)."""
+        return await self._call(dhl_api.token_manager.refresh)
+
+    async def token(self) -> str:
+        return await self._call(dhl_api.token_manager.token)
+
+    async def create_cart(self) -> str:
+        return await self._call(dhl_api.get_shopping_chart_id)
+
+    async def checkout_png(self, shop_order_id, positions) -> dict:
+        return await self._call(dhl_api.checkout_shopping_chart_png, shop_order_id, positions)
+
+    async def resume(self, shop_order_id) -> dict | None:
+        """The order of a checkout whose outcome is unknown, None if the cart is still open."""
+        return await self._call(dhl_api.resume_checkout, shop_order_id)
+
+    async def download(self, link) -> list[tuple[str, bytes]]:
+        """(entry name, PNG bytes) of the postmark ZIP."""
+        return await self._call(dhl_api.download_postmarks, link)
+
+    # ---------- combined ----------
+    async def health_check(self):
+        """API version check and wallet / token refresh at the same time, returns (ok, user)."""
+        ok, user = await asyncio.gather(self.api_version(), self.user())
+        return ok, user
+
+    async def checkout_cart(self, positions) -> dict:
+        """Create a cart, check it out and download its postmarks."""
+        shop_order_id = await self.create_cart()
+        response = await self.checkout_png(shop_order_id, positions)
+        if 'link' not in response:
+            raise Exception(response.get('description', response))
+        postmarks = await self.download(response['link'])
+        return {"shopOrderId": shop_order_id, "response": response, "postmarks": postmarks}
+
+    async def checkout_carts(self, carts, return_exceptions=True) -> list:
+        """
+        Check out several carts concurrently (bounded by max_concurrency).
+        The token is fetched once up front so the carts do not race for it.
+        """
+        await self.token()
+        return await asyncio.gather(*(self.checkout_cart(positions) for positions in carts),
+                                    return_exceptions=return_exceptions)
+
+
+class AsyncLoopThread:
+    """
+    Dedicated event loop in a daemon thread, so the Tk app can run coroutines.
+    submit() returns a concurrent.futures.Future.
+    """
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="dhl-asyncio")
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Blocking helper for background threads: submit and wait for the result."""
+        return self.submit(coro).result(timeout)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
@@ -0,0 +1,143 @@
+# dhl_bulk.py
+# Bulk postmark purchasing: positions are split into carts of at most
+# `max_cart_size`, the carts are checked out in parallel (bounded) and every
+# returned PNG is mapped back to the position it was bought for.
+import asyncio
+import random
+
+import dhl_api
+from dhl_async import AsyncDHLClient
+from dhl_resilience import CircuitOpenError
+
+
+def quote(positions) -> dict:
+    """
+    Cost of the positions (in cents) and the current wallet balance, before anything is bought.
+    """
+    total = sum(int(p['price']) for p in positions)
+    user = dhl_api.token_manager.refresh()
+    wallet = int(user['walletBalance'])
+    return {"count": len(positions), "total": total, "wallet": wallet, "sufficient": wallet >= total}
+
+
+def split_carts(positions, max_cart_size):
+    return [positions[i:i + max_cart_size] for i in range(0, len(positions), max_cart_size)]
+
+
+async def _with_retries(fn, retries, base_delay):
+    for attempt in range(retries + 1):
+        try:
+            return await fn()
+        except Exception:
+            if attempt == retries:
+                raise
+            await asyncio.sleep(base_delay * (2 ** attempt) * (0.5 + random.random()))
+
+
+async def _checkout(dhl, shop_order_id, positions, retries, base_delay) -> dict:
+    """
+    Check out the cart, retried only while nothing can have been bought: every retry asks
+    DHL for the order first, a refusal (no link, e.g. insufficient balance) is final and a
+    CheckoutError with possibly_charged=True is never sent again.
+    """
+    for attempt in range(retries + 1):
+        if attempt:
+            await asyncio.sleep(base_delay * (2 ** (attempt - 1)) * (0.5 + random.random()))
+            try:
+                order = await dhl.resume(shop_order_id)
+            except Exception as e:
+                raise dhl_api.CheckoutError(
+                    f"Warenkorb {shop_order_id} nicht überprüfbar ({e}), möglicherweise wurde gekauft",
+                    shop_order_id, possibly_charged=True,
+                ) from e
+            if order is not None:
+                return order
+
+        try:
+            response = await dhl.checkout_png(shop_order_id, positions)
+        except dhl_api.CheckoutError as e:
+            if e.possibly_charged or attempt == retries:
+                raise
+            continue
+        except CircuitOpenError:
+            # nothing was sent
+            if attempt == retries:
+                raise
+            continue
+
+        if 'link' not in response:
+            raise dhl_api.CheckoutError(str(response.get('description', response)), shop_order_id, possibly_charged=False)
+        return response
+
+
+async def _purchase_cart(dhl, positions, retries, base_delay):
+    # the cart is created once, a failed checkout is only sent again after DHL
+    # confirmed that the cart is still open (see _checkout)
+    shop_order_id = await _with_retries(dhl.create_cart, retries, base_delay)
+    response = await _checkout(dhl, shop_order_id, positions, retries, base_delay)
+
+    # the postmarks are paid from here on, a failure must not leave the orders open silently
+    try:
+        postmarks = await _with_retries(lambda: dhl.download(response['link']), retries, base_delay)
+    except Exception as e:
+        raise dhl_api.CheckoutError(
+            f"Warenkorb {shop_order_id} gekauft, Download fehlgeschlagen ({e})", shop_order_id, possibly_charged=True,
+        ) from e
+    if len(postmarks) != len(positions):
+        raise dhl_api.CheckoutError(
+            f"Cart {shop_order_id}: {len(postmarks)} postmarks for {len(positions)} positions",
+            shop_order_id, possibly_charged=True,
+        )
+    return shop_order_id, postmarks
+
+
+async def purchase_bulk_async(positions, max_cart_size=20, max_concurrency=3, retries=2,
+                              base_delay=1.0, on_progress=None) -> list[dict]:
+    """
+    Buy postmarks for all positions ({receiver, product_code, price, ...}).
+
+    Returns one result per position, in the order of `positions`:
+        {"position": p, "png": bytes | None, "name": ZIP entry | None, "shopOrderId": str | None,
+         "error": str | None, "possibly_charged": bool}
+
+    A position with possibly_charged=True may have been paid without a postmark
+    coming back, the shopOrderId must be checked before it is bought again.
+    """
+    dhl = AsyncDHLClient(max_concurrency=max_concurrency)
+    carts = split_carts(list(positions), max_cart_size)
+    await dhl.token()
+
+    done = 0
+
+    async def run(cart):
+        nonlocal done
+        try:
+            shop_order_id, postmarks = await _purchase_cart(dhl, cart, retries, base_delay)
+            results = [
+                {"position": p, "png": png, "name": name, "shopOrderId": shop_order_id, "error": None,
+                 "possibly_charged": False}
+                for p, (name, png) in zip(cart, postmarks)
+            ]
+        except Exception as e:
+            shop_order_id = getattr(e, "shop_order_id", None)
+            possibly_charged = getattr(e, "possibly_charged", False)
+            results = [
+                {"position": p, "png": None, "name": None, "shopOrderId": shop_order_id, "error": str(e),
+                 "possibly_charged": possibly_charged}
+                for p in cart
+            ]
+        done += 1
+        if on_progress:
+            on_progress(done, len(carts))
+        return results
+
+    per_cart = await asyncio.gather(*(run(cart) for cart in carts))
+    return [result for cart_results in per_cart for result in cart_results]
+
+
+def purchase_bulk(positions, loop_thread=None, **kwargs) -> list[dict]:
+    """Blocking wrapper, runs on `loop_thread` (dhl_async.AsyncLoopThread) if given."""
+    coro = purchase_bulk_async(positions, **kwargs)
+    if loop_thread is not None:
+        return loop_thread.run(coro)
+    return asyncio.run(coro)
@@ -0,0 +1,271 @@
+# dhl_fake_server.py
+# Local stand-in for the Internetmarke endpoints used by dhl_api, for tests,
+# benchmarks and offline runs. Point the client at it with
+# dhl_api.client.base_url = server.base_url or DHL_API_BASE_URL=<base_url> in the .env
+import argparse
+import io
+import json
+import random
+import threading
+import time
+import uuid
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+API_PREFIX = "/post/de/shipping/im/v1"
+
+# smallest valid 1x1 PNG
+FAKE_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010802000000907753de"
+    "0000000c49444154789c63f8ffff3f0005fe02fe0def46b80000000049454e44ae426082"
+)
+
+
+class FakeInternetmarkeServer(ThreadingHTTPServer):
+    """
+    Serves /user, /app/shoppingcart, /app/shoppingcart/png, /app/shoppingcart/{id}
+    and the ZIP download link.
+
+    latency:    seconds added to every response, `jitter` adds up to that many more
+    error_rate: share of requests answered with a random 5xx (the request is not processed)
+    wallet:     balance in cents, a checkout above it is refused, every checkout is booked
+
+    Errors can also be queued for one endpoint with fail_next(), see ENDPOINTS.
+
+    Usage:
+        with FakeInternetmarkeServer() as server:
+            dhl_api.client.base_url = server.base_url
+            ...
+    """
+    daemon_threads = True
+
+    # endpoint names used by latency / fail_next(), same as in dhl_api.DHLClient.request
+    ENDPOINTS = ("version", "user", "shoppingcart", "shoppingcart/get", "shoppingcart/png", "download")
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, error_rate=0.0, wallet=100000, seed=None):
+        super().__init__((host, port), _Handler)
+        self.lock = threading.Lock()
+        self.carts = {}      # shopOrderId -> checkout response or None
+        self.downloads = {}  # download id -> zip bytes
+        self.requests = []   # (method, path) of every request
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.wallet = wallet
+        self.spent = 0
+        self._failures = {}  # endpoint -> [(status, mode), ...]
+        self._random = random.Random(seed)
+        self._thread = None
+
+    def fail_next(self, endpoint, status=503, count=1, after=False):
+        """
+        Answer the next `count` calls of `endpoint` with `status`. With after=True the
+        request is processed first and only the response is replaced (a lost response).
+        """
+        with self.lock:
+            self._failures.setdefault(endpoint, []).extend([(status, after)] * count)
+
+    def stats(self) -> dict:
+        with self.lock:
+            checked_out = sum(1 for cart in self.carts.values() if cart)
+            return {"requests": len(self.requests), "carts": len(self.carts), "checked_out": checked_out,
+                    "wallet": self.wallet, "spent": self.spent}
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{API_PREFIX}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ---------- fault injection ----------
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(self.latency + self._random.random() * self.jitter)
+
+    def injected_failure(self, endpoint):
+        """(status, after) for this request or None."""
+        with self.lock:
+            queued = self._failures.get(endpoint)
+            if queued:
+                return queued.pop(0)
+            if self.error_rate and self._random.random() < self.error_rate:
+                return self._random.choice((500, 502, 503)), False
+        return None
+
+    # ---------- endpoint logic ----------
+    def handle_user(self, form):
+        with self.lock:
+            wallet = self.wallet
+        return 200, {
+            "access_token": uuid.uuid4().hex,
+            "walletBalance": wallet,
+            "token_type": "BearerToken",
+            "expires_in": 3600,
+            "issued_at": "2025-01-01T00:00:00Z",
+            "external_customer_id": "fake",
+            "authenticated_user": form.get("username") or "fake@example.com",
+        }
+
+    def handle_create_cart(self):
+        with self.lock:
+            shop_order_id = str(len(self.carts) + 1)
+            self.carts[shop_order_id] = None
+        return 200, {"shopOrderId": shop_order_id}
+
+    def handle_get_cart(self, shop_order_id):
+        with self.lock:
+            if shop_order_id not in self.carts:
+                return 404, {"title": "Not Found", "description": f"Unknown shopOrderId {shop_order_id}"}
+            return 200, self.carts[shop_order_id] or {"shopOrderId": shop_order_id}
+
+    def handle_checkout_png(self, body):
+        positions = body.get("positions", [])
+        shop_order_id = str(body.get("shopOrderId"))
+        total = int(body.get("total", 0))
+        with self.lock:
+            if shop_order_id not in self.carts:
+                return 404, {"title": "Not Found", "description": f"Unknown shopOrderId {shop_order_id}"}
+            if self.carts[shop_order_id]:
+                return 409, {"title": "Conflict", "description": f"Shopping cart {shop_order_id} is already checked out"}
+            if total > self.wallet:
+                return 400, {"title": "Insufficient balance", "description": f"walletBalance {self.wallet} < total {total}"}
+            self.wallet -= total
+            self.spent += total
+
+            download_id = uuid.uuid4().hex
+            buf = io.BytesIO()
+            with zipfile.ZipFile(buf, "w") as z:
+                for i in range(len(positions)):
+                    z.writestr(f"{i}.png", FAKE_PNG)
+            self.downloads[download_id] = buf.getvalue()
+
+            response = {
+                "type": "CheckoutShoppingCartAppResponse",
+                "link": f"{self.base_url}/download/{download_id}.zip",
+                "manifestLink": None,
+                "shoppingCart": {
+                    "shopOrderId": shop_order_id,
+                    "voucherList": [{"voucherId": f"{shop_order_id}-{i}"} for i in range(len(positions))],
+                },
+                "walletBallance": self.wallet,
+            }
+            self.carts[shop_order_id] = response
+        return 200, response
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload, content_type="application/json"):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _path(self):
+        path = self.path.split("?", 1)[0]
+        return path[len(API_PREFIX):] if path.startswith(API_PREFIX) else path
+
+    def _authorized(self):
+        if self.headers.get("Authorization", "").startswith("Bearer "):
+            return True
+        self._send(401, {"title": "Unauthorized", "description": "Missing bearer token"})
+        return False
+
+    def _dispatch(self, endpoint, handler):
+        """Run handler() -> (status, payload[, content type]) with latency and injected errors."""
+        self.server.delay()
+        failure = self.server.injected_failure(endpoint)
+        if failure and not failure[1]:
+            return self._send(failure[0], {"title": "Injected error", "description": endpoint})
+        result = handler()
+        if failure:
+            return self._send(failure[0], {"title": "Injected error", "description": endpoint})
+        return self._send(*result)
+
+    def do_GET(self):
+        path = self._path()
+        self.server.requests.append(("GET", path))
+        if path in ("", "/"):
+            return self._dispatch("version", lambda: (200, {"amp": {"name": "fake-internetmarke", "version": "1.0"}}))
+        if path.startswith("/download/"):
+            download_id = path[len("/download/"):].removesuffix(".zip")
+
+            def download():
+                blob = self.server.downloads.get(download_id)
+                if blob is None:
+                    return 404, {"description": "Unknown download"}
+                return 200, blob, "application/zip"
+            return self._dispatch("download", download)
+        if path.startswith("/app/shoppingcart/"):
+            if not self._authorized():
+                return
+            shop_order_id = path[len("/app/shoppingcart/"):]
+            return self._dispatch("shoppingcart/get", lambda: self.server.handle_get_cart(shop_order_id))
+        self._send(404, {"description": f"Unknown path {path}"})
+
+    def do_POST(self):
+        path = self._path()
+        raw = self._body()
+        self.server.requests.append(("POST", path))
+
+        if path == "/user":
+            from urllib.parse import parse_qs
+            form = {k: v[0] for k, v in parse_qs(raw.decode("utf-8")).items()}
+            return self._dispatch("user", lambda: self.server.handle_user(form))
+
+        if not self._authorized():
+            return
+
+        if path == "/app/shoppingcart":
+            return self._dispatch("shoppingcart", self.server.handle_create_cart)
+        if path == "/app/shoppingcart/png":
+            return self._dispatch("shoppingcart/png", lambda: self.server.handle_checkout_png(json.loads(raw or b"{}")))
+        self._send(404, {"description": f"Unknown path {path}"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake of the DHL Internetmarke API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to that many seconds on top of --latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 5xx")
+    parser.add_argument("--wallet", type=int, default=100000, help="wallet balance in cents")
+    args = parser.parse_args()
+
+    server = FakeInternetmarkeServer(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                                     error_rate=args.error_rate, wallet=args.wallet)
+    print(f"Fake Internetmarke API on {server.base_url}")
+    print(f"Set DHL_API_BASE_URL={server.base_url} to use it")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(server.stats())
+
+
+if __name__ == "__main__":
+    main()
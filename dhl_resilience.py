@@ -0,0 +1,117 @@
+# dhl_resilience.py
+# Timeouts, retries and a circuit breaker for the Internetmarke API (used by dhl_api.DHLClient).
+import random
+import threading
+import time
+
+# (connect, read) seconds per endpoint name, see DHLClient.request(endpoint=...)
+ENDPOINT_TIMEOUTS = {
+    "version": (3, 5),
+    "user": (5, 15),
+    "shoppingcart": (5, 15),
+    "shoppingcart/get": (5, 15),
+    "shoppingcart/png": (5, 60),
+    "shoppingcart/pdf": (5, 60),
+    "download": (5, 60),
+}
+
+# responses worth another try, everything else (4xx) is final
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """The API failed too often in a row, calls fail fast until `reset_timeout` passed."""
+
+
+def backoff_delay(attempt, base_delay=0.5, max_delay=8.0) -> float:
+    """Exponential backoff with jitter, attempt 0 is the first retry."""
+    return min(max_delay, base_delay * (2 ** attempt)) * (0.5 + random.random())
+
+
+class RetryPolicy:
+    """
+    How often a call is repeated. Only idempotent calls are retried (GET / HEAD
+    or requests marked idempotent), a checkout is never sent twice.
+    """
+    def __init__(self, retries=2, base_delay=0.5, max_delay=8.0, sleep=time.sleep):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+
+    def wait(self, attempt, response=None):
+        delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = min(self.max_delay, max(delay, float(retry_after)))
+        self.sleep(delay)
+
+
+class CircuitBreaker:
+    """
+    closed    -> calls pass, `failure_threshold` failures in a row open the circuit
+    open      -> calls raise CircuitOpenError for `reset_timeout` seconds
+    half-open -> one trial call, success closes the circuit, failure opens it again
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._counters = {"opened": 0, "rejected": 0, "failures": 0, "successes": 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def before_call(self):
+        """Raise CircuitOpenError if the call must not be sent."""
+        with self._lock:
+            state = self._current_state()
+            if state == "closed":
+                return
+            if state == "half-open" and not self._trial_running:
+                self._trial_running = True
+                return
+            self._counters["rejected"] += 1
+            retry_in = max(0.0, self._opened_at + self.reset_timeout - self._clock())
+        raise CircuitOpenError(f"DHL API nicht erreichbar, nächster Versuch in {retry_in:.0f}s")
+
+    def record_success(self):
+        with self._lock:
+            self._counters["successes"] += 1
+            self._failures = 0
+            self._state = "closed"
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._counters["failures"] += 1
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                if self._state != "open":
+                    self._counters["opened"] += 1
+                self._state = "open"
+                self._opened_at = self._clock()
+            self._trial_running = False
+
+    def reset(self):
+        with self._lock:
+            self._state = "closed"
+            self._failures = 0
+            self._trial_running = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"state": self._current_state(), "consecutive_failures": self._failures, **self._counters}
+
+    def _current_state(self):
+        if self._state == "open" and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = "half-open"
+            self._trial_running = False
+        return self._state
@@ -1,16 +1,14 @@
-from MSSQLDatabase import MSSQLDatabase
+import threading
+from itertools import islice
 
-def fetch_orders(db, days=90, lieferschein_exists=False, is_online_order=True):
-    """
-    Fetch orders from the database based on the given parameters.
+from address import Address, format_jtl_fields
 
-    :param db: MSSQLDatabase instance
-    :param days: Number of days to look back for orders
-    :param lieferschein_exists: Whether a Lieferschein should exist
-    :param is_online_order: Whether the order should be an online order
-    :return: List of orders
-    """
+# column indexes of the rows returned by _orders_query()
+COL_AUFTRAGS_NR = 0
+COL_K_AUFTRAG = 3
+COL_ORDER_DATE = 5
 
+def _where_conditions(lieferschein_exists=False, is_online_order=True):
     # Build the WHERE clause dynamically
     conditions = []
     if is_online_order:
@@ -20,10 +18,17 @@ def fetch_orders(db, days=90, lieferschein_exists=False, is_online_order=True):
     else:
         conditions.append("lfs.kLieferschein IS NULL")
     conditions.append("a.dErstellt >= DATEADD(DAY, -?, GETDATE())")
+    return conditions
+
+def _orders_query(conditions, paged=False):
     where_clause = " AND ".join(conditions)
+    # paged queries are a keyset on kAuftrag (identity, so newest first as well),
+    # the caller adds "a.kAuftrag < ?" for the rows after the last page
+    order = "a.kAuftrag DESC" if paged else "a.dErstellt DESC, a.kAuftrag DESC"
+    paging = "OFFSET 0 ROWS FETCH NEXT ? ROWS ONLY" if paged else ""
 
     # Define the SQL query
-    query = f"""
+    return f"""
     SELECT 
         a.cAuftragsNr,
         lfs.cLieferscheinNr,
@@ -50,54 +55,209 @@ def fetch_orders(db, days=90, lieferschein_exists=False, is_online_order=True):
         ON a.kAuftrag = lfs.kBestellung
     WHERE 
         {where_clause}
-    ORDER BY a.dErstellt DESC;
+    ORDER BY {order}
+    {paging};
     """
 
-    # Execute the query
+def iter_orders(db, days=90, lieferschein_exists=False, is_online_order=True, batch_size=100):
+    """
+    Lazily fetch orders, yields one formatted address at a time.
+
+    Rows are pulled from the server in batches of `batch_size`, so the first
+    address is available before the whole look-back window has been transferred.
+    Close the generator when you do not need the remaining rows.
+
+    :param db: MSSQLDatabase instance
+    :param days: Number of days to look back for orders
+    :param lieferschein_exists: Whether a Lieferschein should exist
+    :param is_online_order: Whether the order should be an online order
+    :param batch_size: Number of rows fetched per round-trip
+    :return: Generator of formatted addresses
+    """
+    query = _orders_query(_where_conditions(lieferschein_exists, is_online_order))
+
+    rows = db.iter_results(query, [days], batch_size=batch_size)
     try:
-        results = db.fetch_results(query, [days])
+        # format batch by batch, the first addresses are still available early
+        while batch := list(islice(rows, batch_size)):
+            yield from format_rows(batch)[0]
+    finally:
+        rows.close()
+
+def iter_new_order_rows(db, watermark, is_online_order=True, batch_size=500):
+    """
+    Raw rows of orders without Lieferschein created after `watermark`,
+    a (dErstellt, kAuftrag) tuple as kept by jtl_mirror.OrderMirror.
+    """
+    conditions = _where_conditions(False, is_online_order)[:-1]
+    conditions.append("(a.dErstellt > ? OR (a.dErstellt = ? AND a.kAuftrag > ?))")
+    created, k_auftrag = watermark
+    return db.iter_results(_orders_query(conditions), [created, created, k_auftrag], batch_size=batch_size)
 
-        #print(results)
-        return list(map(_format_address, results))
+def fetch_orders(db, days=90, lieferschein_exists=False, is_online_order=True):
+    """
+    Fetch orders from the database based on the given parameters.
+
+    :param db: MSSQLDatabase instance
+    :param days: Number of days to look back for orders
+    :param lieferschein_exists: Whether a Lieferschein should exist
+    :param is_online_order: Whether the order should be an online order
+    :return: List of orders
+    """
+
+    # Execute the query
+    try:
+        return list(iter_orders(db, days, lieferschein_exists, is_online_order))
     except Exception as e:
         print(f"An error occurred: {e}")
         return []
 
-def _format_address(addr: list[str]) -> str:
+def fetch_delivered(db, k_auftraege, chunk_size=1000):
     """
-    Map a raw 2D array row (company, title, last, first, street, postal, city, country)
-    into a formatted address block.
+    Return the subset of the given kAuftrag ids that have a tLieferschein entry.
+    The ids are sent in chunks to stay below the SQL Server parameter limit (2100).
+    """
+    k_auftraege = list(k_auftraege)
+    delivered = set()
+    for i in range(0, len(k_auftraege), chunk_size):
+        chunk = k_auftraege[i:i + chunk_size]
+        placeholders = ", ".join("?" * len(chunk))
+        query = f"SELECT DISTINCT kBestellung FROM dbo.tLieferschein WHERE kBestellung IN ({placeholders});"
+        delivered.update(row[0] for row in db.fetch_results(query, chunk))
+    return delivered
+
+
+class OrderQueue:
+    """
+    Persistent cursor over the open orders which hands out the next unprinted
+    addresses page by page (4 per A4 sheet by default).
+
+    Every page is a server side keyset query (kAuftrag below the last one handed
+    out), so only the rows which are about to be printed are transferred. Printed
+    orders are marked with mark_consumed() and excluded in SQL from then on. When
+    the end of the list is reached the cursor starts from the top again, so orders
+    which were handed out but not printed come back.
+
+    The queue is used from the Tk thread and from JobRunner workers, every method
+    takes the queue lock (next_page() holds it over its queries, so two imports
+    never hand out the same page).
+
+    Usage:
+        queue = OrderQueue(days=30)
+        with MSSQLDatabase.pooled_with_env() as db:
+            page = queue.next_page(db)          # [(kAuftrag, Address), ...]
+        ...
+        queue.mark_consumed(k for k, _ in page)
     """
-     # slice from column 6
-    company, title, last, first, street, postal, city, country = addr[6:14]
+    def __init__(self, days=90, page_size=4, is_online_order=True):
+        self.days = days
+        self.page_size = page_size
+        self.is_online_order = is_online_order
+        self.last_k_auftrag = None  # keyset cursor, None = start from the newest order
+        self.consumed = set()  # kAuftrag of printed orders
+        self._lock = threading.Lock()
+
+    def reset(self, days=None):
+        """Start from the newest order again, consumed orders stay skipped."""
+        with self._lock:
+            self._reset(days)
+
+    def _reset(self, days=None):
+        if days is not None:
+            self.days = days
+        self.last_k_auftrag = None
+
+    def _use_days(self, days):
+        # a different look-back window starts from the newest order again
+        if days is not None and days != self.days:
+            self._reset(days)
+
+    def _open_orders(self, after=None, paged=False):
+        """Query and parameters of the open orders without the consumed ones."""
+        conditions = _where_conditions(False, self.is_online_order)
+        params = [self.days]
+        if after is not None:
+            conditions.append("a.kAuftrag < ?")
+            params.append(after)
+        if self.consumed:
+            # one parameter for any number of orders, the IN list would hit the 2100 parameter limit
+            conditions.append("a.kAuftrag NOT IN (SELECT CAST(value AS INT) FROM STRING_SPLIT(?, ','))")
+            params.append(",".join(map(str, self.consumed)))
+        return _orders_query(conditions, paged=paged), params
 
-    lines = []
+    def next_page(self, db, size=None, days=None) -> list[tuple[int, Address]]:
+        """The next `size` unprinted orders, `days` switches the look-back window first."""
+        with self._lock:
+            self._use_days(days)
+            return self._next_page(db, self.page_size if size is None else size)
 
-    # company line (with newline after if non-empty)
-    if company.strip():
-        lines.append(company.strip())
+    def _next_page(self, db, size):
+        page = []
+        seen = set()
+        wrapped = self.last_k_auftrag is None
+        while len(page) < size:
+            query, params = self._open_orders(self.last_k_auftrag, paged=True)
+            rows = db.fetch_results(query, params + [size - len(page)])
+            if not rows:
+                if wrapped:
+                    break
+                # end of the list, start over to pick up orders handed out but not printed
+                self.last_k_auftrag = None
+                wrapped = True
+                continue
 
-    # person line (first + title + last, skipping empties, adding spaces between)
-    name_parts = [first.strip(), title.strip(), last.strip()]
-    name = " ".join([p for p in name_parts if p])
-    if name:
-        lines.append(name)
+            self.last_k_auftrag = rows[-1][COL_K_AUFTRAG]
+            fresh = []
+            for row in rows:
+                k_auftrag = row[COL_K_AUFTRAG]
+                if k_auftrag in seen:  # second delivery address row of the same order
+                    continue
+                seen.add(k_auftrag)
+                fresh.append(row)
+            page.extend(zip((row[COL_K_AUFTRAG] for row in fresh), format_rows(fresh)[1]))
+        return page
 
-    # street
-    if street.strip():
-        lines.append(street.strip())
+    def remaining(self, db, days=None) -> list[tuple[int, Address]]:
+        """All open orders which were not printed yet, newest first (one query, no paging)."""
+        with self._lock:
+            self._use_days(days)
+            query, params = self._open_orders()
+        rows = []
+        seen = set()
+        for row in db.iter_results(query, params):
+            k_auftrag = row[COL_K_AUFTRAG]
+            if k_auftrag in seen:  # second delivery address row of the same order
+                continue
+            seen.add(k_auftrag)
+            rows.append(row)
+        return list(zip((row[COL_K_AUFTRAG] for row in rows), format_rows(rows)[1]))
 
-    # postal + city
-    if postal.strip() or city.strip():
-        lines.append(f"{postal.strip()} {city.strip()}".strip())
+    def mark_consumed(self, k_auftraege):
+        k_auftraege = [k for k in k_auftraege if k is not None]
+        with self._lock:
+            self.consumed.update(k_auftraege)
 
-    # country
-    if country.strip():
-        lines.append(country.strip())
+    def consumed_keys(self) -> set:
+        """Copy of the consumed kAuftrag ids, safe to use while workers mark orders."""
+        with self._lock:
+            return set(self.consumed)
 
-    return "\n".join(lines)
+# columns 6..13 of _orders_query(): cFirma, cAnrede, cName, cVorname, cStrasse, cPLZ, cOrt, cLand
+_ADDRESS_COLUMNS = slice(6, 14)
+
+def format_rows(rows) -> tuple[list[str], list[Address]]:
+    """format_jtl_fields() of raw _orders_query() rows."""
+    return format_jtl_fields([row[_ADDRESS_COLUMNS] for row in rows])
+
+def _format_address(addr: list[str]) -> str:
+    """
+    Map a raw 2D array row (company, title, last, first, street, postal, city, country)
+    into a formatted address block.
+    """
+    return format_rows([addr])[0][0]
 
 def main():
+    from MSSQLDatabase import MSSQLDatabase
     with MSSQLDatabase.connect_with_env() as db:
         r = fetch_orders(db, 30)
         print(r)
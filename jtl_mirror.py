@@ -0,0 +1,241 @@
+import datetime as dt
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from address import Address, format_jtl_fields
+from jtl_api import (
+    COL_K_AUFTRAG, COL_ORDER_DATE,
+    _orders_query, _where_conditions, format_rows,
+    fetch_delivered, iter_new_order_rows,
+)
+from utils import asset_path
+
+MIRROR_FILE = "jtl_mirror.sqlite3"
+
+# same order as the columns selected by jtl_api._orders_query()
+_COLUMNS = [
+    "auftrags_nr", "lieferschein_nr", "k_kunde", "k_auftrag", "k_inet_kunde", "order_date",
+    "firma", "anrede", "name", "vorname", "street", "plz", "city", "country", "address_additional",
+]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    k_auftrag          INTEGER PRIMARY KEY,
+    auftrags_nr        TEXT,
+    lieferschein_nr    TEXT,
+    k_kunde            INTEGER,
+    k_inet_kunde       INTEGER,
+    order_date         TEXT NOT NULL,
+    firma              TEXT,
+    anrede             TEXT,
+    name               TEXT,
+    vorname            TEXT,
+    street             TEXT,
+    plz                TEXT,
+    city               TEXT,
+    country            TEXT,
+    address_additional TEXT,
+    address            TEXT NOT NULL,
+    delivered          INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_orders_date ON orders (order_date);
+CREATE INDEX IF NOT EXISTS idx_orders_nr ON orders (auftrags_nr);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class OrderMirror:
+    """
+    Local SQLite copy of the open JTL shipping orders.
+
+    sync() pulls new orders from MSSQL (newer than the last (dErstellt, kAuftrag) seen)
+    and flags orders which got a Lieferschein, orders() reads the formatted
+    addresses from the local file without any network round-trip.
+
+    Usage:
+        mirror = OrderMirror()
+        with MSSQLDatabase.pooled_with_env() as db:
+            mirror.sync(db, days=90)
+        addresses = mirror.orders(days=30)
+    """
+    def __init__(self, path=None, is_online_order=True):
+        self.path = path or asset_path(MIRROR_FILE)
+        self.is_online_order = is_online_order
+        self._lock = threading.Lock()  # one writer at a time
+        with self._connect() as con:
+            con.execute("PRAGMA journal_mode=WAL")  # readers are not blocked by the refresher
+            con.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        con = sqlite3.connect(self.path, timeout=10)
+        try:
+            with con:  # commit / rollback
+                yield con
+        finally:
+            con.close()
+
+    # ---------- meta ----------
+    def _get_meta(self, con, key):
+        row = con.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, con, key, value):
+        con.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    @property
+    def last_sync(self) -> dt.datetime | None:
+        with self._connect() as con:
+            value = self._get_meta(con, "last_sync")
+        return dt.datetime.fromisoformat(value) if value else None
+
+    @property
+    def watermark(self):
+        with self._connect() as con:
+            value = self._get_meta(con, "watermark")
+        if not value:
+            return None
+        created, k_auftrag = value.split("|")
+        return dt.datetime.fromisoformat(created), int(k_auftrag)
+
+    @property
+    def synced_from(self) -> dt.datetime | None:
+        """Lower bound of the synced window, orders older than that are not in the mirror."""
+        with self._connect() as con:
+            value = self._get_meta(con, "synced_from")
+        return dt.datetime.fromisoformat(value) if value else None
+
+    def covers(self, days) -> bool:
+        """True if the mirror holds all open orders of the last `days`."""
+        synced_from = self.synced_from
+        return synced_from is not None and dt.datetime.now() - dt.timedelta(days=days) >= synced_from
+
+    # ---------- sync ----------
+    def sync(self, db, days=90) -> int:
+        """
+        Pull new orders from MSSQL into the mirror.
+        The first sync, and every sync with a `days` window reaching further back than
+        the synced one, loads the whole window. Returns the number of loaded rows.
+        """
+        with self._lock:
+            watermark = self.watermark
+            cutoff = dt.datetime.now() - dt.timedelta(days=days)
+            synced_from = self.synced_from
+            if watermark is None or synced_from is None or cutoff < synced_from:
+                # full window, older orders are backfilled, held orders which got a Lieferschein are flagged
+                rows = db.iter_results(_orders_query(_where_conditions(False, self.is_online_order)), [days])
+                delivered = fetch_delivered(db, self._open_k_auftraege()) if watermark is not None else set()
+            else:
+                delivered = fetch_delivered(db, self._open_k_auftraege())
+                rows = iter_new_order_rows(db, watermark, self.is_online_order)
+
+            rows = list(rows)
+            for row in rows:
+                key = (row[COL_ORDER_DATE], row[COL_K_AUFTRAG])
+                if watermark is None or key > watermark:
+                    watermark = key
+            values = [
+                tuple(row[:len(_COLUMNS)]) + (text,)
+                for row, text in zip(rows, format_rows(rows)[0])
+            ]
+
+            with self._connect() as con:
+                con.executemany(
+                    f"INSERT OR REPLACE INTO orders ({', '.join(_COLUMNS)}, address) "
+                    f"VALUES ({', '.join('?' * (len(_COLUMNS) + 1))})",
+                    [self._to_sqlite(v) for v in values],
+                )
+                con.executemany("UPDATE orders SET delivered = 1 WHERE k_auftrag = ?", [(k,) for k in delivered])
+                con.execute("DELETE FROM orders WHERE order_date < ?", (cutoff.isoformat(sep=" "),))
+                if watermark is not None:
+                    self._set_meta(con, "watermark", f"{watermark[0].isoformat(sep=' ')}|{watermark[1]}")
+                self._set_meta(con, "last_sync", dt.datetime.now().isoformat(sep=" "))
+                self._set_meta(con, "synced_from", cutoff.isoformat(sep=" "))
+            return len(values)
+
+    def _open_k_auftraege(self) -> list[int]:
+        with self._connect() as con:
+            return [r[0] for r in con.execute("SELECT k_auftrag FROM orders WHERE delivered = 0")]
+
+    @staticmethod
+    def _to_sqlite(values):
+        return tuple(v.isoformat(sep=" ") if isinstance(v, dt.datetime) else v for v in values)
+
+    # ---------- read ----------
+    def orders(self, days=90, limit=None) -> list[str]:
+        """Formatted addresses of open orders of the last `days`, newest first."""
+        return [address.text for _, address in self.open_orders(days, limit)]
+
+    def open_orders(self, days=90, limit=None, exclude=()) -> list[tuple[int, Address]]:
+        """(kAuftrag, Address) of open orders of the last `days`, newest first, without `exclude`d ids."""
+        cutoff = dt.datetime.now() - dt.timedelta(days=days)
+        query = ("SELECT k_auftrag, firma, anrede, name, vorname, street, plz, city, country FROM orders "
+                 "WHERE delivered = 0 AND order_date >= ? ORDER BY order_date DESC, k_auftrag DESC")
+        rows = []
+        with self._connect() as con:
+            for row in con.execute(query, (cutoff.isoformat(sep=" "),)):
+                if row[0] in exclude:
+                    continue
+                rows.append(row)
+                if limit is not None and len(rows) >= limit:
+                    break
+        return list(zip((row[0] for row in rows), format_jtl_fields([row[1:] for row in rows])[1]))
+
+    def clear(self):
+        with self._lock, self._connect() as con:
+            con.execute("DELETE FROM orders")
+            con.execute("DELETE FROM meta")
+
+
+class MirrorRefresher:
+    """
+    Background thread which keeps an OrderMirror in sync with MSSQL.
+    Errors (e.g. JTL server down) are kept in `last_error`, the mirror stays readable.
+    """
+    def __init__(self, mirror: OrderMirror, days=90, interval=60.0):
+        self.mirror = mirror
+        self.days = days
+        self.interval = interval
+        self.last_error = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def refresh_now(self):
+        """Wake the refresher up before the interval elapsed."""
+        self._wake.set()
+
+    def is_running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def _run(self):
+        # the queries only need a db object, pyodbc (and the ODBC driver) is loaded when the thread starts
+        from MSSQLDatabase import MSSQLDatabase
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                with MSSQLDatabase.pooled_with_env() as db:
+                    new_rows = self.mirror.sync(db, days=self.days)
+                self.last_error = None
+                print(f"JTL mirror synced: {new_rows} new orders in {time.monotonic() - started:.2f}s")
+            except Exception as e:
+                self.last_error = e
+                print(f"JTL mirror sync failed: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
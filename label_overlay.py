@@ -0,0 +1,118 @@
+"""
+Overlay rendering of label sheets.
+
+Everything which is the same on every label (logo, sender line, cell geometry of
+labels.html) is rendered once by WeasyPrint into a background PDF page. Per sheet
+only the receiver text and the postmark PNGs are stamped onto that background with
+PyMuPDF, no HTML / CSS layout is involved.
+
+The geometry below mirrors the absolute positions in assets/labels.html.
+"""
+import os
+import threading
+
+import fitz  # PyMuPDF
+
+from utils import asset_path
+
+MM = 72 / 25.4  # millimeter -> PDF points
+
+# left, top of every A6 cell on the A4 sheet (mm)
+CELL_ORIGINS = {"tl": (0, 0), "tr": (105, 0), "bl": (0, 147), "br": (105, 147)}
+CELL_W, CELL_H = 105, 147
+
+# receiver block: rotated -90deg around (50mm, 122mm), reads bottom to top,
+# `width` in labels.html is the length of a line, lines stack to the right.
+# tr / br have no width in the html and shrink to the 55mm left in the cell (105 - 50),
+# which also keeps the lines below the postmark (STAMP_RECT_MM ends at 61.5mm)
+RECV_LEFT, RECV_BASE = 50, 122
+RECV_LINE_LENGTH = {"tl": 50, "tr": 55, "bl": 50, "br": 55}
+# embedded TrueType font, the base-14 "helv" only has Latin-1 glyphs (Długa -> D?uga)
+RECV_FONT = "dejavu"
+RECV_FONT_FILE = "DejaVuSans.ttf"
+RECV_FONT_SIZES = (12, 10, 8)  # 16px like the html, smaller if the address does not fit
+
+# postmark: 53 x 30mm box at (38mm, 20mm) rotated -90deg around its center
+STAMP_RECT_MM = (38 + 26.5 - 15, 20 + 15 - 26.5, 38 + 26.5 + 15, 20 + 15 + 26.5)
+
+_background_cache = {}  # (send_addr, template mtime, logo mtime) -> pdf bytes
+_background_lock = threading.Lock()
+
+
+def _rect_mm(x0, y0, x1, y1) -> fitz.Rect:
+    return fitz.Rect(x0 * MM, y0 * MM, x1 * MM, y1 * MM)
+
+
+def background_pdf(send_addr) -> bytes:
+    """
+    One A4 page with logo and sender line in all four cells, rendered by WeasyPrint
+    once per sender address and template / logo version.
+    """
+    from prepare_print_pdf import SLOTS, TEMPLATE_NAME, _render_pdf, _sheet
+
+    key = (
+        send_addr,
+        os.path.getmtime(asset_path(TEMPLATE_NAME)),
+        os.path.getmtime(asset_path("header.png")),
+    )
+    with _background_lock:
+        blob = _background_cache.get(key)
+        if blob is None:
+            # a blank (but truthy) receiver renders the cell without receiver text
+            resources = {}
+            blob = _render_pdf(send_addr, [_sheet([" "] * len(SLOTS), [], resources)], resources)
+            _background_cache.clear()
+            _background_cache[key] = blob
+    return blob
+
+
+def _insert_receiver(page, slot, text):
+    left, top = CELL_ORIGINS[slot]
+    rect = _rect_mm(
+        left + RECV_LEFT, top + RECV_BASE - RECV_LINE_LENGTH[slot],
+        left + CELL_W, top + RECV_BASE,
+    )
+    for size in RECV_FONT_SIZES:
+        # insert_textbox writes nothing and returns < 0 if the text does not fit
+        if page.insert_textbox(rect, text, fontname=RECV_FONT, fontfile=asset_path(RECV_FONT_FILE),
+                               fontsize=size, rotate=90) >= 0:
+            return
+    print(f"Receiver text does not fit into the {slot} label: {text!r}")
+
+
+def _insert_postmark(page, slot, png):
+    left, top = CELL_ORIGINS[slot]
+    x0, y0, x1, y1 = STAMP_RECT_MM
+    page.insert_image(_rect_mm(left + x0, top + y0, left + x1, top + y1), stream=png, rotate=90)
+
+
+def render_sheets(send_addr, sheets) -> bytes:
+    """
+    Render sheets on top of the cached background.
+
+    :param send_addr: sender address line
+    :param sheets: list of (data, postmarks) tuples, one entry per slot (tl, tr, bl, br),
+                   False leaves the slot (or its postmark) empty
+    :return: PDF bytes with one page per sheet
+    """
+    from prepare_print_pdf import SLOTS
+
+    with fitz.open(stream=background_pdf(send_addr), filetype="pdf") as bg, fitz.open() as out:
+        page_rect = bg[0].rect
+        for data, postmarks in sheets:
+            page = out.new_page(width=page_rect.width, height=page_rect.height)
+            for i, slot in enumerate(SLOTS):
+                text = data[i] if i < len(data) else False
+                if not text:
+                    continue
+                left, top = CELL_ORIGINS[slot]
+                cell = _rect_mm(left, top, left + CELL_W, top + CELL_H)
+                # the background page becomes one shared form xobject in the output
+                page.show_pdf_page(cell, bg, 0, clip=cell)
+                _insert_receiver(page, slot, text)
+
+                postmark = postmarks[i] if i < len(postmarks) else False
+                if postmark:
+                    _insert_postmark(page, slot, postmark)
+
+        return out.tobytes(garbage=3, deflate=True)
@@ -1,3 +1,5 @@
+import multiprocessing
+
 from dotenv import load_dotenv
 from window import App
 
@@ -15,4 +17,6 @@ def main():
 
 
 if __name__ == '__main__': 
+    # required for the render process pool in the PyInstaller build
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
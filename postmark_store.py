@@ -0,0 +1,282 @@
+# postmark_store.py
+# Bought postmarks: PNG blobs sharded below assets/marks/, metadata in an SQLite index.
+import datetime as dt
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from utils import asset_path
+
+MARKS_PATH = "marks"
+INDEX_FILE = "postmarks.sqlite3"
+
+def default_retention_days() -> int:
+    """POSTMARK_RETENTION_DAYS, an Internetmarke is valid for three years, older ones are removed by compact()."""
+    return int(os.getenv("POSTMARK_RETENTION_DAYS", 3 * 365))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS postmarks (
+    key           TEXT PRIMARY KEY,
+    receiver_hash TEXT,
+    product_id    TEXT,
+    date          TEXT NOT NULL,
+    order_ref     TEXT,
+    product_code  TEXT,
+    price         INTEGER,
+    shop_order_id TEXT,
+    created_at    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_postmarks_date ON postmarks (date);
+CREATE INDEX IF NOT EXISTS idx_postmarks_receiver ON postmarks (receiver_hash, product_id, date);
+"""
+
+
+def _today() -> str:
+    return dt.date.today().strftime('%Y-%m-%d')
+
+
+def postmark_hash(receiver, product_id, date=None):
+    """md5 of the postmark position, the key of the postmark in the store"""
+    postmark_position = { "receiver": receiver, "product_id": product_id, "date": date or _today() }
+    return hashlib.md5(json.dumps(postmark_position).encode('utf-8')).hexdigest()
+
+
+def receiver_hash(receiver) -> str:
+    return hashlib.md5(receiver.encode('utf-8')).hexdigest()
+
+
+class PostmarkStore:
+    """
+    marks/<key[:2]>/<key>.png plus an index (marks/postmarks.sqlite3) with date,
+    product, price and order of every postmark. The keys are kept in a set, so
+    contains() / get() never scan the directory.
+
+    Usage:
+        store = PostmarkStore.default()
+        png = store.get(receiver, '270')
+        store.put(receiver, '270', png, price=270, shop_order_id='...')
+    """
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, root=None, retention_days=None):
+        self.root = root or asset_path(MARKS_PATH)
+        self.retention_days = retention_days  # None = default_retention_days() at compact() time
+        os.makedirs(self.root, exist_ok=True)
+        self.index_path = os.path.join(self.root, INDEX_FILE)
+        self._lock = threading.Lock()
+        with self._connect() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.executescript(_SCHEMA)
+        self._keys = set()
+        self.version = 0  # incremented on every change of the key set, cheap to poll from the UI
+        self._stamp = None
+        self._watcher = None
+        self._watch_stop = threading.Event()
+        self.reload()
+
+    @classmethod
+    def default(cls) -> "PostmarkStore":
+        """Store below assets/marks shared by the whole application."""
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+            return cls._default
+
+    @contextmanager
+    def _connect(self):
+        con = sqlite3.connect(self.index_path, timeout=10)
+        try:
+            with con:  # commit / rollback
+                yield con
+        finally:
+            con.close()
+
+    def blob_path(self, key) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.png")
+
+    # ---------- lookups ----------
+    def reload(self):
+        """Load the keys of all postmarks in the index into memory."""
+        stamp = self._index_stamp()
+        with self._connect() as con:
+            keys = {row[0] for row in con.execute("SELECT key FROM postmarks")}
+        with self._lock:
+            self._stamp = stamp
+            if keys != self._keys:
+                self._keys = keys
+                self.version += 1
+
+    def reload_if_changed(self) -> bool:
+        """Reload the keys if the index files changed on disk (e.g. written by another instance)."""
+        if self._index_stamp() == self._stamp:
+            return False
+        self.reload()
+        return True
+
+    def watch(self, interval=2.0):
+        """Poll the index files every `interval` seconds in a daemon thread, see reload_if_changed()."""
+        if self._watcher is not None:
+            return
+
+        def run():
+            while not self._watch_stop.wait(interval):
+                try:
+                    self.reload_if_changed()
+                except sqlite3.Error as e:
+                    print(f"Postmark index reload failed: {e}")
+
+        self._watch_stop.clear()
+        self._watcher = threading.Thread(target=run, name="postmark-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watch(self):
+        self._watch_stop.set()
+        self._watcher = None
+
+    def _index_stamp(self):
+        stamp = []
+        for path in (self.index_path, self.index_path + "-wal"):
+            try:
+                st = os.stat(path)
+                stamp.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def contains(self, key) -> bool:
+        return key in self._keys
+
+    def __contains__(self, key):
+        return self.contains(key)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def has(self, receiver, product_id, date=None) -> bool:
+        return bool(product_id) and postmark_hash(receiver, product_id, date) in self._keys
+
+    def get(self, receiver, product_id, date=None):
+        """PNG bytes of the postmark bought for this receiver / product on `date` (today), False if there is none."""
+        if not product_id:
+            return False
+        return self.get_by_key(postmark_hash(receiver, product_id, date))
+
+    def get_by_key(self, key):
+        if key not in self._keys:
+            return False
+        try:
+            with open(self.blob_path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            print(f"Postmark {key} is indexed but its file is missing")
+            return False
+
+    def info(self, key) -> dict | None:
+        with self._connect() as con:
+            con.row_factory = sqlite3.Row
+            row = con.execute("SELECT * FROM postmarks WHERE key = ?", (key,)).fetchone()
+        return dict(row) if row else None
+
+    # ---------- writes ----------
+    def put(self, receiver, product_id, png, date=None, order_ref=None, product_code=None,
+            price=None, shop_order_id=None) -> str:
+        """Store a bought postmark, returns its key."""
+        date = date or _today()
+        key = postmark_hash(receiver, product_id, date)
+        self._write_blob(key, png)
+        with self._connect() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO postmarks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, receiver_hash(receiver), product_id, date,
+                 None if order_ref is None else str(order_ref),
+                 None if product_code is None else str(product_code),
+                 price, shop_order_id, dt.datetime.now().isoformat(timespec="seconds")),
+            )
+        with self._lock:
+            self._keys.add(key)
+            self.version += 1
+        return key
+
+    def _write_blob(self, key, png):
+        path = self.blob_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, 'wb') as f:
+            f.write(png)
+        os.replace(tmp, path)
+
+    # ---------- maintenance ----------
+    def import_legacy(self) -> int:
+        """
+        Move the flat marks/<hash>.png files of older versions into the store.
+        Receiver and product are unknown for them, the date is taken from the file.
+        """
+        rows = []
+        for entry in os.scandir(self.root):
+            if not (entry.is_file() and entry.name.endswith(".png")):
+                continue
+            key = entry.name[:-len(".png")]
+            mtime = dt.datetime.fromtimestamp(entry.stat().st_mtime)
+            target = self.blob_path(key)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(entry.path, target)
+            rows.append((key, mtime.strftime('%Y-%m-%d'), mtime.isoformat(timespec="seconds")))
+
+        if rows:
+            with self._connect() as con:
+                con.executemany(
+                    "INSERT OR IGNORE INTO postmarks (key, date, created_at) VALUES (?, ?, ?)", rows,
+                )
+            with self._lock:
+                self._keys.update(key for key, _, _ in rows)
+                self.version += 1
+            print(f"Imported {len(rows)} postmarks into the postmark store")
+        return len(rows)
+
+    def compact(self, retention_days=None) -> int:
+        """Remove postmarks older than `retention_days` (index rows and files), returns the number removed."""
+        if retention_days is None:
+            retention_days = self.retention_days if self.retention_days is not None else default_retention_days()
+        cutoff = (dt.date.today() - dt.timedelta(days=retention_days)).strftime('%Y-%m-%d')
+        with self._connect() as con:
+            expired = [row[0] for row in con.execute("SELECT key FROM postmarks WHERE date < ?", (cutoff,))]
+            con.executemany("DELETE FROM postmarks WHERE key = ?", [(key,) for key in expired])
+
+        with self._lock:
+            self._keys.difference_update(expired)
+            if expired:
+                self.version += 1
+        shards = set()
+        for key in expired:
+            shards.add(os.path.dirname(self.blob_path(key)))
+            try:
+                os.remove(self.blob_path(key))
+            except FileNotFoundError:
+                pass
+        for shard in shards:
+            # another instance may have removed the shard or written into it meanwhile
+            try:
+                if not os.listdir(shard):
+                    os.rmdir(shard)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Could not remove postmark folder {shard}: {e}")
+
+        if expired:
+            con = sqlite3.connect(self.index_path, timeout=10)
+            try:
+                con.execute("VACUUM")
+            finally:
+                con.close()
+            print(f"Removed {len(expired)} expired postmarks")
+        return len(expired)
+
+    def stats(self) -> dict:
+        with self._connect() as con:
+            count, oldest, newest = con.execute("SELECT COUNT(*), MIN(date), MAX(date) FROM postmarks").fetchone()
+        return {"count": count, "oldest": oldest, "newest": newest, "in_memory": len(self._keys)}
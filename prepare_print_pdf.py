@@ -1,5 +1,9 @@
-from jinja2 import Template
-from weasyprint import HTML
+import os
+import tempfile
+import time
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from weasyprint import HTML, default_url_fetcher
 
 from utils import asset_path
 
@@ -12,7 +16,9 @@ def _insert_breaklines(line):
     return False
 
 import base64
+import hashlib
 import mimetypes
+import threading
 
 def image_bytes_to_base64_uri(image_bytes: bytes, mime_type: str = "image/png") -> str:
     """
@@ -31,37 +37,235 @@ def image_file_to_base64_uri(path: str) -> str:
         encoded = base64.b64encode(f.read()).decode("ascii")
     return f"data:{mime};base64,{encoded}"
 
-def prepare_pdf_blob( send_addr, data, postmarks ):
-    # convert images
-    for i in range(len(postmarks)):
-        if postmarks[i]:
-            postmarks[i] = image_bytes_to_base64_uri(postmarks[i])
+# ---------- static assets ----------
+ASSET_SCHEME = "asset:"        # asset:header.png -> assets/header.png, served from the cache
+POSTMARK_SCHEME = "postmark:"  # postmark:<sha1> -> postmark bytes of the current render
+
+_asset_cache = {}  # path -> (mtime, bytes)
+_asset_lock = threading.Lock()
+
+def load_asset(path: str) -> bytes:
+    """Read a static file once, it is read again only when its mtime changes."""
+    mtime = os.path.getmtime(path)
+    with _asset_lock:
+        cached = _asset_cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    with open(path, "rb") as f:
+        blob = f.read()
+    with _asset_lock:
+        _asset_cache[path] = (mtime, blob)
+    return blob
+
+def _make_url_fetcher(resources: dict):
+    """
+    WeasyPrint url_fetcher which serves asset: urls from the asset cache and
+    postmark: urls from `resources`, everything else goes to the default fetcher.
+    WeasyPrint decodes every url once per document, so the logo shared by all
+    labels is only decoded once.
+    """
+    def fetcher(url, *args, **kwargs):
+        if url.startswith(ASSET_SCHEME):
+            path = asset_path(url[len(ASSET_SCHEME):])
+            mime, _ = mimetypes.guess_type(path)
+            return {"string": load_asset(path), "mime_type": mime or "application/octet-stream"}
+        if url.startswith(POSTMARK_SCHEME):
+            return {"string": resources[url], "mime_type": "image/png"}
+        return default_url_fetcher(url, *args, **kwargs)
+    return fetcher
+
+SLOTS = ("tl", "tr", "bl", "br")  # four A6 labels per A4 sheet
+
+def _sheet(data, postmarks, resources):
+    """
+    Template context of one A4 sheet, `data` and `postmarks` have one entry per slot.
+    Postmark bytes are put into `resources` and referenced by a postmark: url.
+    """
+    sheet = {}
+    for i, slot in enumerate(SLOTS):
+        sheet[slot] = _insert_breaklines(data[i]) if i < len(data) else False
+        postmark = postmarks[i] if i < len(postmarks) else False
+        if postmark:
+            url = POSTMARK_SCHEME + hashlib.sha1(postmark).hexdigest()
+            resources[url] = postmark
+            sheet[f"{slot}_img"] = url
+        else:
+            sheet[f"{slot}_img"] = False
+    return sheet
+
+# ---------- debug dump ----------
+# LABEL_DEBUG_HTML=1 (or the settings toggle) writes the rendered html to assets/tmp.html
+_debug_html = None  # set by the settings toggle, None = LABEL_DEBUG_HTML
+_debug_lock = threading.Lock()
+
+def set_debug_html(enabled: bool):
+    global _debug_html
+    _debug_html = bool(enabled)
+
+def debug_html_enabled() -> bool:
+    # read on use, the .env file is loaded after this module is imported
+    if _debug_html is None:
+        return os.getenv("LABEL_DEBUG_HTML", "0") == "1"
+    return _debug_html
+
+def _dump_html_async(html: str):
+    """Write the html in a background thread, replaced atomically so concurrent renders do not mix."""
+    def write():
+        target = asset_path("tmp.html")
+        with _debug_lock:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".html.part")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(html)
+                os.replace(tmp_path, target)
+            except OSError as e:
+                print(f"Could not write debug html: {e}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    threading.Thread(target=write, daemon=True).start()
+
+TEMPLATE_NAME = "labels.html"
 
-    labels_file = asset_path("labels.html")
-    html_tpl = open(labels_file, "r", encoding="utf-8").read()
-    
-    data = list(map(_insert_breaklines, data))
+_template_env = None
+_last_template = None
 
-     # Convert logo.png to base64 data URI
-    logo_data_uri = image_file_to_base64_uri(asset_path("header.png"))
+# seconds spent in the last render: template (load / compile), render (jinja), pdf (weasyprint)
+last_timings = {"template": 0.0, "compiled": False, "render": 0.0, "pdf": 0.0}
 
-    t = Template(html_tpl)
+def template_env() -> Environment:
+    """
+    Process wide jinja2 environment for the assets folder.
+    Templates are compiled once and recompiled only when the file mtime changes
+    (auto_reload), compiled bytecode is kept in the temp folder between runs.
+    """
+    global _template_env
+    if _template_env is None:
+        cache_dir = os.path.join(tempfile.gettempdir(), "labelprinter_jinja_cache")
+        os.makedirs(cache_dir, exist_ok=True)
+        _template_env = Environment(
+            loader=FileSystemLoader(os.path.dirname(asset_path(TEMPLATE_NAME))),
+            bytecode_cache=FileSystemBytecodeCache(cache_dir),
+            auto_reload=True,
+        )
+    return _template_env
+
+def _get_template():
+    global _last_template
+    start = time.perf_counter()
+    t = template_env().get_template(TEMPLATE_NAME)
+    last_timings["template"] = time.perf_counter() - start
+    last_timings["compiled"] = t is not _last_template
+    _last_template = t
+    return t
+
+def _render_pdf(send_addr, sheets, resources):
+    t = _get_template()
+    start = time.perf_counter()
     html = t.render(
-        logo_url=logo_data_uri,
-        tl=data[0], tr=data[1], bl=data[2], br=data[3],
+        logo_url=ASSET_SCHEME + "header.png",
         send_addr= send_addr,
-        tl_img=postmarks[0],   # per-segment extra picture (optional)
-        tr_img=postmarks[1],   # per-segment extra picture (optional)
-        bl_img=postmarks[2],
-        br_img=postmarks[3],
-        
+        sheets=sheets,
     )
+    last_timings["render"] = time.perf_counter() - start
 
-    tmp_file = asset_path("tmp.html")
-    open(tmp_file, "w", encoding="utf-8").write(html)
+    if debug_html_enabled():
+        _dump_html_async(html)
 
     # base_url="." makes relative image paths work
-    h = HTML(string=html, base_url=".")
+    start = time.perf_counter()
+    h = HTML(string=html, base_url=".", url_fetcher=_make_url_fetcher(resources))
 
     pdf_blob = h.write_pdf()
+    last_timings["pdf"] = time.perf_counter() - start
+    if debug_html_enabled():
+        print("Label render: template {template:.4f}s (compiled: {compiled}), render {render:.4f}s, pdf {pdf:.4f}s".format(**last_timings))
     return pdf_blob
+
+# "html": every sheet is laid out by WeasyPrint
+# "overlay": static background rendered once, text and postmarks stamped on with PyMuPDF (label_overlay.py)
+def render_mode() -> str:
+    """LABEL_RENDER_MODE, read on use since the .env file is loaded after this module is imported."""
+    return os.getenv("LABEL_RENDER_MODE", "html")
+
+def pool_min_sheets() -> int:
+    """Batches with at least LABEL_POOL_MIN_SHEETS sheets (default 8) are rendered by the process pool."""
+    return int(os.getenv("LABEL_POOL_MIN_SHEETS", 8))
+
+def render_workers() -> int:
+    """Number of render processes, LABEL_RENDER_WORKERS or the cpu count (1 disables the pool)."""
+    return int(os.getenv("LABEL_RENDER_WORKERS", 0)) or os.cpu_count() or 1
+
+_render_cache = None
+
+def render_cache():
+    """
+    Process wide RenderCache, LABEL_RENDER_CACHE_MB caps memory, LABEL_RENDER_CACHE_DIR enables
+    the disk tier and LABEL_RENDER_CACHE_DISK_MB caps it.
+    """
+    global _render_cache
+    if _render_cache is None:
+        from render_cache import RenderCache
+        _render_cache = RenderCache(
+            max_bytes=int(float(os.getenv("LABEL_RENDER_CACHE_MB", 64)) * 1024 * 1024),
+            disk_dir=os.getenv("LABEL_RENDER_CACHE_DIR") or None,
+            disk_max_bytes=int(float(os.getenv("LABEL_RENDER_CACHE_DISK_MB", 512)) * 1024 * 1024),
+        )
+    return _render_cache
+
+def template_version() -> str:
+    """Changes whenever labels.html or the logo changes."""
+    template = hashlib.sha1(load_asset(asset_path(TEMPLATE_NAME))).hexdigest()
+    logo = os.path.getmtime(asset_path("header.png"))
+    return f"{template}:{logo}"
+
+def prepare_pdf_blob( send_addr, data, postmarks, mode=None ):
+    """
+    Render one A4 sheet, `data` and `postmarks` are lists with one entry per slot
+    (tl, tr, bl, br), False leaves the slot empty.
+    """
+    return _render_cached(send_addr, [(list(data), list(postmarks))], mode)
+
+def prepare_pdf_batch_blob( send_addr, receivers, postmarks=None, mode=None ):
+    """
+    Render any number of receiver blocks into one multi page PDF, four labels per
+    A4 page in slot order (tl, tr, bl, br). `postmarks` is an optional list of PNG
+    bytes (or False) with the same length as `receivers`.
+    """
+    receivers = list(receivers)
+    postmarks = list(postmarks) if postmarks else [False] * len(receivers)
+
+    chunks = [
+        (receivers[i:i + len(SLOTS)], postmarks[i:i + len(SLOTS)])
+        for i in range(0, len(receivers), len(SLOTS))
+    ]
+    return _render_cached(send_addr, chunks, mode)
+
+def _render_cached( send_addr, chunks, mode=None ):
+    from render_cache import cache_key
+
+    mode = mode or render_mode()
+    key = cache_key(template_version(), mode, send_addr, chunks)
+    pdf_blob = render_cache().get(key)
+    if pdf_blob is not None:
+        return pdf_blob
+
+    # large batches are rendered in parallel by a process pool (render_pool.py)
+    if len(chunks) >= pool_min_sheets() and render_workers() > 1:
+        from render_pool import render_parallel
+        pdf_blob = render_parallel(send_addr, chunks, mode)
+    else:
+        pdf_blob = render_chunks(send_addr, chunks, mode)
+
+    render_cache().put(key, pdf_blob)
+    return pdf_blob
+
+def render_chunks( send_addr, chunks, mode=None ):
+    """Render (data, postmarks) sheet tuples into one PDF in the calling process."""
+    if (mode or render_mode()) == "overlay":
+        from label_overlay import render_sheets
+        return render_sheets(send_addr, chunks)
+
+    resources = {}
+    sheets = [_sheet(data, marks, resources) for data, marks in chunks]
+    return _render_pdf(send_addr, sheets, resources)
@@ -0,0 +1,180 @@
+# render_cache.py
+# Content addressed cache for rendered label PDFs, so previewing and printing the
+# same sheet (or reprinting a jammed one) renders it only once.
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+
+class RenderCache:
+    """
+    LRU cache of PDF bytes with a size cap in bytes and an optional on-disk tier.
+    The disk tier is capped by `disk_max_bytes`, the least recently used files
+    (oldest mtime, a disk hit touches the file) are removed first.
+    Keys are hex digests, see cache_key().
+    """
+    def __init__(self, max_bytes=64 * 1024 * 1024, disk_dir=None, disk_max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()  # key -> pdf bytes, most recently used last
+        self._size = 0
+        self._disk_size = None  # bytes in disk_dir, counted on the first write
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key) -> bytes | None:
+        with self._lock:
+            blob = self._entries.get(key)
+            if blob is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return blob
+
+        blob = self._read_disk(key)
+        with self._lock:
+            if blob is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._put_memory(key, blob)
+        return blob
+
+    def put(self, key, blob: bytes):
+        self._put_memory(key, blob)
+        self._write_disk(key, blob)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+    def _put_memory(self, key, blob):
+        if len(blob) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = blob
+            self._size += len(blob)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.pdf")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                blob = f.read()
+        except OSError:
+            return None
+        try:
+            os.utime(self._disk_path(key))  # mtime is the LRU order of the disk tier
+        except OSError:
+            pass
+        return blob
+
+    def _write_disk(self, key, blob):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.part"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(blob)
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not write render cache entry: {e}")
+            return
+
+        with self._disk_lock:
+            if self._disk_size is None:
+                self._disk_size = sum(size for _, size, _ in self._disk_entries())
+            else:
+                self._disk_size += len(blob) - replaced
+            if self._disk_size > self.disk_max_bytes:
+                self._evict_disk()
+
+    def _disk_entries(self):
+        """(mtime, size, path) of the cached PDFs on disk."""
+        entries = []
+        with os.scandir(self.disk_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(".pdf"):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        return entries
+
+    def _evict_disk(self):
+        # must be called with self._disk_lock held, removes the oldest files down to 90% of the cap
+        entries = sorted(self._disk_entries())
+        size = sum(size for _, size, _ in entries)
+        target = self.disk_max_bytes * 0.9
+        for _, file_size, path in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Could not remove render cache entry: {e}")
+                continue
+            size -= file_size
+        self._disk_size = size
+
+
+def cache_key(template_version: str, mode: str, send_addr, chunks) -> str:
+    """
+    sha256 over everything which ends up on the sheets: template version, render
+    mode, sender address, receiver texts and the hashes of the postmark PNGs.
+    """
+    h = hashlib.sha256()
+
+    def feed(value):
+        data = value if isinstance(value, bytes) else str(value).encode("utf-8")
+        h.update(len(data).to_bytes(8, "little"))
+        h.update(data)
+
+    feed(template_version)
+    feed(mode)
+    feed(send_addr or "")
+    for data, postmarks in chunks:
+        feed(len(data))
+        for text in data:
+            feed(text or "")
+        feed(len(postmarks))
+        for postmark in postmarks:
+            feed(hashlib.sha256(postmark).digest() if postmark else b"")
+    return h.hexdigest()
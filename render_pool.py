@@ -0,0 +1,69 @@
+# render_pool.py
+# Parallel label rendering: sheets are split into contiguous groups, every group is
+# rendered by a worker process and the resulting PDFs are merged with PyMuPDF.
+import math
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+
+from prepare_print_pdf import render_workers
+
+_executor = None
+_executor_workers = 0  # max_workers the executor was created with
+_executor_lock = threading.Lock()
+
+
+def _warm_up():
+    """Runs once in every worker: import weasyprint and compile the label template."""
+    import prepare_print_pdf
+    prepare_print_pdf._get_template()
+
+
+def _render_group(send_addr, chunks, mode):
+    from prepare_print_pdf import render_chunks
+    return render_chunks(send_addr, chunks, mode)
+
+
+def _get_executor() -> tuple[ProcessPoolExecutor, int]:
+    """The shared executor and its number of workers."""
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None:
+            _executor_workers = render_workers()
+            _executor = ProcessPoolExecutor(max_workers=_executor_workers, initializer=_warm_up)
+        return _executor, _executor_workers
+
+
+def warm_up_pool():
+    """Start the workers in the background so the first batch does not pay the import cost."""
+    executor, workers = _get_executor()
+    for _ in range(workers):
+        executor.submit(_warm_up)
+
+
+def shutdown_pool():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def render_parallel(send_addr, chunks, mode=None) -> bytes:
+    """
+    Render (data, postmarks) sheet tuples in the process pool and merge them in order.
+    """
+    executor, workers = _get_executor()
+    group_size = max(1, math.ceil(len(chunks) / workers))
+
+    futures = [
+        executor.submit(_render_group, send_addr, chunks[i:i + group_size], mode)
+        for i in range(0, len(chunks), group_size)
+    ]
+
+    with fitz.open() as merged:
+        for future in futures:
+            with fitz.open(stream=future.result(), filetype="pdf") as part:
+                merged.insert_pdf(part)
+        return merged.tobytes(garbage=3, deflate=True)
@@ -0,0 +1,62 @@
+import datetime as dt
+import os
+import sys
+
+import pytest
+
+# the modules live in the repository root, next to main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeJTL:
+    """
+    Stand-in for a pooled MSSQLDatabase: answers the queries built by jtl_api
+    (_orders_query with its conditions, fetch_delivered) from rows in memory.
+    """
+    def __init__(self):
+        self.rows = []         # raw _orders_query() rows, an order may have several address rows
+        self.delivered = set()  # kAuftrag with a tLieferschein
+        self.transferred = []  # kAuftrag of every order row sent to the client
+
+    def add_order(self, k_auftrag, days_ago=0, last="Kunde", country="Deutschland"):
+        created = dt.datetime.now().replace(microsecond=0) - dt.timedelta(days=days_ago, minutes=k_auftrag)
+        row = (f"AU{k_auftrag}", None, 1, k_auftrag, 1, created,
+               "", "", f"{last} {k_auftrag}", "Anna", "Bachstraße 1", "96188", "Stettfeld", country, "")
+        self.rows.append(row)
+        return row
+
+    def fetch_results(self, query, params=None):
+        params = list(params or [])
+        if "FROM dbo.tLieferschein" in query:
+            return [(k,) for k in params if k in self.delivered]
+
+        rows = [r for r in self.rows if r[3] not in self.delivered]
+        if "DATEADD" in query:
+            cutoff = dt.datetime.now() - dt.timedelta(days=params.pop(0))
+            rows = [r for r in rows if r[5] >= cutoff]
+        if "a.dErstellt > ?" in query:
+            created, _, k_auftrag = params[:3]
+            del params[:3]
+            rows = [r for r in rows if (r[5], r[3]) > (created, k_auftrag)]
+        if "a.kAuftrag < ?" in query:
+            after = params.pop(0)
+            rows = [r for r in rows if r[3] < after]
+        if "STRING_SPLIT" in query:
+            consumed = {int(k) for k in params.pop(0).split(",")}
+            rows = [r for r in rows if r[3] not in consumed]
+
+        if "FETCH NEXT" in query:
+            rows = sorted(rows, key=lambda r: r[3], reverse=True)[:params.pop(0)]
+        else:
+            rows = sorted(rows, key=lambda r: (r[5], r[3]), reverse=True)
+        assert not params, f"unused parameters {params}"
+        self.transferred.extend(r[3] for r in rows)
+        return rows
+
+    def iter_results(self, query, params=None, batch_size=500):
+        yield from self.fetch_results(query, params)
+
+
+@pytest.fixture
+def jtl():
+    return FakeJTL()
@@ -0,0 +1,31 @@
+from address import Address, format_jtl_fields
+from dhl_api import struct_address
+
+
+def test_text_skips_empty_lines():
+    address = Address("Anna Nowak", "", "ul. Długa 5", "", "00-950", "Warszawa", "Polen")
+    assert address.text == "Anna Nowak\nul. Długa 5\n00-950 Warszawa\nPolen"
+    assert Address(city="Berlin").text == "Berlin"
+
+
+def _record(*fields):
+    return format_jtl_fields([fields])[1][0]
+
+
+def test_format_jtl_fields():
+    record = _record("frapp GmbH", "", "Scharf", "Andreas", "Bachstraße 24-26", "96188", "Stettfeld", "Deutschland")
+    assert record.text == "frapp GmbH\nAndreas Scharf\nBachstraße 24-26\n96188 Stettfeld\nDeutschland"
+    assert struct_address(record.text) == record
+    assert _record("", "", "Nr 5", "Haus", "Am Markt 1", "10115", "Berlin", "Deutschland").name == "Haus Nr 5"
+
+
+def test_format_jtl_fields_null_and_short_rows():
+    # NULL columns (no tAdresse row) and short rows do not break the formatting
+    assert _record(None, None, "Nowak", "Anna", None, "00-950", None, "Polen") == \
+        Address("Anna Nowak", "", "", "", "00-950", "", "Polen")
+    texts, records = format_jtl_fields([(None,) * 8, ("frapp GmbH", "", "Scharf"), (" Haus ", "", "Nr", "", "", 10115, "", "")])
+    assert texts == ["", "frapp GmbH\nScharf", "Haus\nNr\n10115"]
+    assert records[0] == Address()
+    assert records[1] == Address("frapp GmbH", "Scharf")
+    assert records[2].postalcode == "10115" and records[2].additional_name == "Nr"
+    assert type(records[0]) is Address
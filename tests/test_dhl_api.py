@@ -1,48 +1,125 @@
-from dhl_api import struct_address
+import pytest
 
-name, addiditional_name, street, street2, postalcode, city, country = struct_address(
-    """frapp GmbH
+from address import Address
+from dhl_api import DHLTokenManager, _position_addresses, struct_address, struct_addresses
+from dhl_resilience import CircuitBreaker, CircuitOpenError, backoff_delay
+
+RECEIVER = "Andreas Scharf\nBachstraße 24-26\n96188 Stettfeld\nDeutschland"
+
+
+def test_struct_address_company():
+    name, addiditional_name, street, street2, postalcode, city, country = struct_address(
+        """frapp GmbH
 Bachstraße 24-26
 96188 Stettfeld
 Deutschland
 """)
-print(name, addiditional_name, street, street2, postalcode, city, country)
+    assert name == 'frapp GmbH'
+    assert addiditional_name == ''
+    assert street == 'Bachstraße 24-26'
+    assert postalcode == '96188'
+    assert city == 'Stettfeld'
+    assert country == 'Deutschland'
 
-assert name == 'frapp GmbH'
-assert addiditional_name == ''
-assert street == 'Bachstraße 24-26'
-assert postalcode == '96188'
-assert city == 'Stettfeld'
-assert country == 'Deutschland'
 
-
-name, addiditional_name, street, street2, postalcode, city, contry = struct_address(
-    """Andreas Scharf
+def test_struct_address_additional_name():
+    name, addiditional_name, street, street2, postalcode, city, country = struct_address(
+        """Andreas Scharf
 frapp GmbH
 Bachstraße 24-26
 96188 Stettfeld
 Deutschland
 """)
-assert name == 'Andreas Scharf'
-assert addiditional_name == 'frapp GmbH'
-assert street == 'Bachstraße 24-26'
-assert postalcode == '96188'
-assert city == 'Stettfeld'
-assert country == 'Deutschland'
-
-name, addiditional_name, street, street2, postalcode, city, contry = struct_address(
-    """Andreas Scharf
+    assert name == 'Andreas Scharf'
+    assert addiditional_name == 'frapp GmbH'
+    assert street == 'Bachstraße 24-26'
+    assert postalcode == '96188'
+    assert city == 'Stettfeld'
+    assert country == 'Deutschland'
+
+
+def test_struct_address_second_street_line():
+    name, addiditional_name, street, street2, postalcode, city, country = struct_address(
+        """Andreas Scharf
 frapp GmbH
 Bachstraße 24-26
 Postfach 20
 96188 Stettfeld
 Deutschland
 """)
+    assert name == 'Andreas Scharf'
+    assert addiditional_name == 'frapp GmbH'
+    assert street == 'Bachstraße 24-26'
+    assert street2 == 'Postfach 20'
+    assert postalcode == '96188'
+    assert city == 'Stettfeld'
+    assert country == 'Deutschland'
+
+
+def test_struct_addresses_international():
+    international = struct_addresses([
+        "Jan de Vries\nKeizersgracht 12\n1015 CS Amsterdam\nNiederlande",
+        "Anna Nowak\nul. Długa 5\n00-950 Warszawa\nPolen",
+        "John Smith\n10 Downing Street\nLondon SW1A 2AA\nVereinigtes Königreich",
+        "Erik Svensson\nStorgatan 1\n114 55 Stockholm\nSchweden",
+        "Maria Huber\nRingstraße 1\nA-1010 Wien\nÖsterreich",
+        "  Andreas Scharf \n\nBachstraße 24-26\n96188 Stettfeld\nDeutschland\n",
+    ])
+    assert [(fields[4], fields[5]) for fields in international] == [
+        ("1015 CS", "Amsterdam"), ("00-950", "Warszawa"), ("SW1A 2AA", "London"),
+        ("114 55", "Stockholm"), ("1010", "Wien"), ("96188", "Stettfeld"),
+    ]
+    assert international[5] == struct_address(RECEIVER)
+
+
+def test_token_manager_caches_the_token():
+    calls = []
+
+    def fake_user():
+        calls.append(1)
+        return {'access_token': f'token-{len(calls)}', 'expires_in': 3600}
+
+    manager = DHLTokenManager(request_user=fake_user)
+    assert manager.token() == 'token-1'
+    assert manager.token() == 'token-1'
+    assert len(calls) == 1
+
+    manager.invalidate()
+    assert manager.token() == 'token-2'
+    assert manager.refresh()['access_token'] == 'token-3'
+
+
+def test_circuit_breaker():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+    breaker.before_call()
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):  # an open circuit fails fast
+        breaker.before_call()
+
+    now[0] = 11
+    assert breaker.state == "half-open"
+    breaker.before_call()           # the one trial call
+    with pytest.raises(CircuitOpenError):  # only one trial call while half-open
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.stats()["opened"] == 1 and breaker.stats()["rejected"] == 2
+
+
+def test_backoff_delay():
+    assert all(0.25 <= backoff_delay(0) <= 0.75 for _ in range(100))
+    assert all(backoff_delay(10, max_delay=8.0) <= 12.0 for _ in range(100))
+
 
-assert name == 'Andreas Scharf'
-assert addiditional_name == 'frapp GmbH'
-assert street == 'Bachstraße 24-26'
-assert street2 == 'Postfach 20'
-assert postalcode == '96188'
-assert city == 'Stettfeld'
-assert country == 'Deutschland'
\ No newline at end of file
+def test_position_addresses_prefer_the_record():
+    # a record is sent as it is, only positions without one are parsed
+    record = Address("frapp GmbH", "Andreas Scharf", "Bachstraße 24-26", "", "96188", "Stettfeld", "Deutschland")
+    parsed, given = _position_addresses([
+        {"receiver": record.text},
+        {"receiver": "does not matter", "address": record._replace(name="Haus Nr 5")},
+    ])
+    assert parsed == record and given.name == "Haus Nr 5"
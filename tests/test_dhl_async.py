@@ -0,0 +1,164 @@
+import asyncio
+
+import pytest
+
+import dhl_api
+from dhl_async import AsyncDHLClient, AsyncLoopThread
+from dhl_bulk import purchase_bulk, quote
+from dhl_fake_server import FakeInternetmarkeServer
+from dhl_resilience import CircuitBreaker, RetryPolicy
+
+POSITIONS = [
+    {"receiver": f"Kunde {i}\nBachstraße {i}\n96188 Stettfeld\nDeutschland", "product_code": 290, "price": 270, "order": i}
+    for i in range(7)
+]
+
+
+@pytest.fixture
+def server():
+    """Fake Internetmarke server the shared dhl_api client talks to."""
+    with FakeInternetmarkeServer() as server:
+        dhl_api.client.base_url = server.base_url
+        dhl_api.token_manager.invalidate()
+        yield server
+        dhl_api.token_manager.invalidate()
+        dhl_api.client.base_url = None
+
+
+def test_checkout_carts_concurrently(server):
+    dhl = AsyncDHLClient(max_concurrency=3)
+
+    ok, user = asyncio.run(dhl.health_check())
+    assert ok
+    assert user['walletBalance'] == 100000
+
+    carts = [
+        [{"receiver": "Andreas Scharf\nBachstraße 24-26\n96188 Stettfeld\nDeutschland", "product_code": 290, "price": 270}] * n
+        for n in (1, 2, 3)
+    ]
+    loop_thread = AsyncLoopThread()
+    try:
+        results = loop_thread.run(dhl.checkout_carts(carts), timeout=30)
+    finally:
+        loop_thread.stop()
+
+    assert [len(r["postmarks"]) for r in results] == [1, 2, 3]
+    assert [name for name, _ in results[2]["postmarks"]] == ["0.png", "1.png", "2.png"]
+    assert all(png.startswith(b"\x89PNG") for _, png in results[2]["postmarks"])
+    assert len({r["shopOrderId"] for r in results}) == 3
+
+
+def test_purchase_bulk_keeps_position_order(server):
+    q = quote(POSITIONS)
+    assert q["total"] == 7 * 270
+    assert q["sufficient"]
+
+    results = purchase_bulk(POSITIONS, max_cart_size=3, max_concurrency=2)
+    assert [r["position"]["order"] for r in results] == list(range(7))
+    assert all(r["png"] and r["error"] is None for r in results)
+    assert len({r["shopOrderId"] for r in results}) == 3
+
+
+def test_resume_checkout(server):
+    shop_order_id = dhl_api.get_shopping_chart_id()
+    assert dhl_api.resume_checkout(shop_order_id) is None
+    assert dhl_api.resume_checkout("unknown") is None
+
+    response = dhl_api.checkout_shopping_chart_png(shop_order_id, POSITIONS[:2])
+    resumed = dhl_api.resume_checkout(shop_order_id)
+    assert resumed["link"] == response["link"]
+    assert dhl_api.client.metrics()["shoppingcart/png"]["resumed"] >= 1
+    assert dhl_api.client.metrics()["circuit"]["state"] == "closed"
+
+
+@pytest.fixture
+def wallet_server(monkeypatch):
+    """Server with 10 EUR in the wallet, configured through DHL_API_BASE_URL and with fast retries."""
+    with FakeInternetmarkeServer(wallet=1000) as server:
+        monkeypatch.setenv("DHL_API_BASE_URL", server.base_url)
+        monkeypatch.setattr(dhl_api.client, "retry", RetryPolicy(retries=2, base_delay=0.01))
+        monkeypatch.setattr(dhl_api.client, "breaker", CircuitBreaker())
+        dhl_api.token_manager.invalidate()
+        yield server
+        dhl_api.token_manager.invalidate()
+
+
+def test_base_url_from_env(wallet_server, monkeypatch):
+    assert dhl_api.client.url("/user") == wallet_server.base_url + "/user"
+    monkeypatch.delenv("DHL_API_BASE_URL")
+    assert dhl_api.client.base_url == dhl_api.DHL_BASE_URL
+
+
+def test_transient_error_is_retried(wallet_server):
+    wallet_server.fail_next("user", status=503)
+    assert dhl_api.token_manager.refresh()["walletBalance"] == 1000
+
+
+def test_lost_checkout_response_is_resumed(wallet_server):
+    shop_order_id = dhl_api.get_shopping_chart_id()
+    wallet_server.fail_next("shoppingcart/png", status=502, after=True)
+    response = dhl_api.checkout_shopping_chart_png(shop_order_id, POSITIONS[:2])
+    assert response["link"]
+    assert wallet_server.stats()["spent"] == 540 and wallet_server.stats()["wallet"] == 460
+
+
+def test_failed_checkout_buys_nothing(wallet_server):
+    shop_order_id = dhl_api.get_shopping_chart_id()
+    wallet_server.fail_next("shoppingcart/png", status=503)
+    with pytest.raises(dhl_api.CheckoutError) as e:
+        dhl_api.checkout_shopping_chart_png(shop_order_id, POSITIONS[:1])
+    assert "nichts gekauft" in str(e.value) and not e.value.possibly_charged
+    assert wallet_server.stats()["wallet"] == 1000
+
+
+def test_checkout_beyond_the_wallet_is_refused(wallet_server):
+    shop_order_id = dhl_api.get_shopping_chart_id()
+    assert "link" not in dhl_api.checkout_shopping_chart_png(shop_order_id, POSITIONS[:4])
+    assert wallet_server.stats()["checked_out"] == 0
+
+
+def test_resume_passes_the_open_circuit(wallet_server):
+    # the lost checkout response opens the circuit, asking for the order still goes through
+    dhl_api.client.breaker = CircuitBreaker(failure_threshold=1)
+    shop_order_id = dhl_api.get_shopping_chart_id()
+    wallet_server.fail_next("shoppingcart/png", status=502, after=True)
+    assert dhl_api.checkout_shopping_chart_png(shop_order_id, POSITIONS[:1])["link"]
+    assert dhl_api.client.breaker.state == "open"
+
+
+def test_unverifiable_checkout_may_have_charged(wallet_server):
+    # the order cannot be asked for either: the error says it may have been bought
+    shop_order_id = dhl_api.get_shopping_chart_id()
+    wallet_server.fail_next("shoppingcart/png", status=502, after=True)
+    wallet_server.fail_next("shoppingcart/get", status=503, count=3)
+    with pytest.raises(dhl_api.CheckoutError) as e:
+        dhl_api.checkout_shopping_chart_png(shop_order_id, POSITIONS[:1])
+    assert e.value.shop_order_id == shop_order_id and e.value.possibly_charged
+    assert dhl_api.resume_checkout(shop_order_id)["link"]
+    assert wallet_server.stats()["wallet"] == 1000 - 270
+
+
+def test_bulk_purchase_never_resends_a_possibly_charged_checkout(wallet_server):
+    # the checkout is booked but its response is lost and DHL can not be asked for the order
+    wallet_server.fail_next("shoppingcart/png", status=502, after=True)
+    wallet_server.fail_next("shoppingcart/get", status=503, count=3)
+    results = purchase_bulk(POSITIONS[:2], max_cart_size=2, max_concurrency=1, base_delay=0.01)
+
+    assert wallet_server.stats()["spent"] == 540 and wallet_server.stats()["checked_out"] == 1
+    assert all(r["png"] is None and r["possibly_charged"] for r in results)
+    assert {r["shopOrderId"] for r in results} == {"1"}
+    assert "already checked out" not in results[0]["error"]
+
+
+def test_bulk_purchase_retry_picks_up_the_booked_checkout(wallet_server):
+    # the cart is still open after the first failure: checked out again, bought once
+    wallet_server.fail_next("shoppingcart/png", status=503)
+    results = purchase_bulk(POSITIONS[:2], max_cart_size=2, max_concurrency=1, base_delay=0.01)
+    assert all(r["png"] and r["error"] is None for r in results)
+    assert wallet_server.stats()["spent"] == 540
+
+
+def test_bulk_purchase_does_not_retry_a_refusal(wallet_server):
+    results = purchase_bulk(POSITIONS[:4], max_cart_size=4, max_concurrency=1, base_delay=0.01)
+    assert all(r["png"] is None and not r["possibly_charged"] for r in results)
+    assert [method for method, path in wallet_server.requests].count("POST") == 3  # user, cart, one checkout
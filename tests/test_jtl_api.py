@@ -0,0 +1,72 @@
+from jtl_api import OrderQueue
+
+
+def keys(page):
+    return [k for k, _ in page]
+
+
+def test_next_page_keyset_is_not_shifted_by_consumed_orders(jtl):
+    for k in range(1, 11):
+        jtl.add_order(k)
+    queue = OrderQueue(days=30, page_size=4)
+
+    first = queue.next_page(jtl)
+    assert keys(first) == [10, 9, 8, 7]
+    queue.mark_consumed(keys(first))
+    assert keys(queue.next_page(jtl)) == [6, 5, 4, 3]
+
+
+def test_next_page_wraps_around_without_consumed_orders(jtl):
+    for k in range(1, 7):
+        jtl.add_order(k)
+    queue = OrderQueue(days=30, page_size=4)
+
+    queue.mark_consumed(keys(queue.next_page(jtl))[:2])  # 6 and 5 printed, 4 and 3 not
+    jtl.transferred.clear()
+
+    # 2, 1 and from the top again the orders handed out but not printed
+    assert keys(queue.next_page(jtl)) == [2, 1, 4, 3]
+    # consumed orders are excluded in SQL, they are never transferred
+    assert not {5, 6} & set(jtl.transferred)
+
+
+def test_next_page_one_entry_per_order(jtl):
+    jtl.add_order(3)
+    jtl.add_order(2)
+    jtl.add_order(2, last="Zweite Lieferadresse")
+    jtl.add_order(1)
+    queue = OrderQueue(days=30, page_size=4)
+    assert keys(queue.next_page(jtl)) == [3, 2, 1]
+
+
+def test_next_page_size(jtl):
+    for k in range(1, 4):
+        jtl.add_order(k)
+    queue = OrderQueue(days=30, page_size=2)
+    assert queue.next_page(jtl, 0) == []
+    assert keys(queue.next_page(jtl)) == [3, 2]
+
+
+def test_next_page_new_window_starts_from_the_top(jtl):
+    jtl.add_order(3, days_ago=1)
+    jtl.add_order(2, days_ago=1)
+    jtl.add_order(1, days_ago=60)
+    queue = OrderQueue(days=30, page_size=1)
+    assert keys(queue.next_page(jtl)) == [3]
+    assert keys(queue.next_page(jtl, days=90)) == [3]
+    assert queue.days == 90
+
+
+def test_remaining_skips_consumed_and_duplicate_rows(jtl):
+    jtl.add_order(3)
+    jtl.add_order(2)
+    jtl.add_order(2, last="Zweite Lieferadresse")
+    jtl.add_order(1)
+    jtl.delivered.add(1)
+    queue = OrderQueue(days=30)
+    queue.mark_consumed([3])
+
+    remaining = queue.remaining(jtl)
+    assert keys(remaining) == [2]
+    assert remaining[0][1].name == "Anna Kunde 2"
+    assert 3 not in jtl.transferred
@@ -0,0 +1,42 @@
+from jtl_mirror import OrderMirror
+
+
+def keys(orders):
+    return [k for k, _ in orders]
+
+
+def test_sync_loads_the_window_then_only_new_orders(jtl, tmp_path):
+    jtl.add_order(1, days_ago=5)
+    jtl.add_order(2, days_ago=2)
+    mirror = OrderMirror(str(tmp_path / "mirror.sqlite3"))
+
+    assert mirror.sync(jtl, days=30) == 2
+    jtl.add_order(3)
+    jtl.transferred.clear()
+    assert mirror.sync(jtl, days=30) == 1
+    assert jtl.transferred == [3]  # only the rows after the watermark
+    assert keys(mirror.open_orders(days=30)) == [3, 2, 1]
+
+
+def test_sync_flags_delivered_orders(jtl, tmp_path):
+    jtl.add_order(1, days_ago=5)
+    jtl.add_order(2, days_ago=2)
+    mirror = OrderMirror(str(tmp_path / "mirror.sqlite3"))
+    mirror.sync(jtl, days=30)
+
+    jtl.delivered.add(2)
+    mirror.sync(jtl, days=30)
+    assert keys(mirror.open_orders(days=30)) == [1]
+
+
+def test_sync_backfills_when_the_window_grows(jtl, tmp_path):
+    jtl.add_order(1, days_ago=60)
+    jtl.add_order(2, days_ago=2)
+    mirror = OrderMirror(str(tmp_path / "mirror.sqlite3"))
+    mirror.sync(jtl, days=30)
+    assert mirror.covers(30) and not mirror.covers(90)
+    assert keys(mirror.open_orders(days=90)) == [2]
+
+    mirror.sync(jtl, days=90)
+    assert mirror.covers(90)
+    assert keys(mirror.open_orders(days=90)) == [2, 1]
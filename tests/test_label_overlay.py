@@ -0,0 +1,30 @@
+import fitz  # PyMuPDF
+
+from label_overlay import _insert_receiver
+
+
+def test_receiver_text_keeps_non_latin1_characters():
+    address = "Anna Nowak\nul. Długa 5\n00-950 Warszawa\nPolska"
+    with fitz.open() as doc:
+        page = doc.new_page(width=595, height=842)
+        _insert_receiver(page, "tl", address)
+        text = page.get_text()
+
+    assert "Długa" in text
+    assert "?" not in text
+
+
+def test_receiver_text_stays_clear_of_the_postmark():
+    from label_overlay import CELL_ORIGINS, STAMP_RECT_MM, _rect_mm
+
+    address = "Sehr lange Firmenbezeichnung Handelsgesellschaft mbH\nAnna Nowak\nul. Długa 5\n00-950 Warszawa\nPolska"
+    for slot, (left, top) in CELL_ORIGINS.items():
+        x0, y0, x1, y1 = STAMP_RECT_MM
+        stamp = _rect_mm(left + x0, top + y0, left + x1, top + y1)
+        with fitz.open() as doc:
+            page = doc.new_page(width=595, height=842)
+            _insert_receiver(page, slot, address)
+            words = page.get_text("words")
+
+        assert "Handelsgesellschaft" in {w[4] for w in words}, slot
+        assert not any(fitz.Rect(w[:4]).intersects(stamp) for w in words), slot
@@ -0,0 +1,111 @@
+import threading
+
+import pytest
+
+pytest.importorskip("pyodbc", exc_type=ImportError)  # also skips without the ODBC driver manager
+
+import MSSQLDatabase
+from MSSQLDatabase import MSSQLConnectionPool, PoolTimeoutError
+
+
+class StubCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, params=None):
+        if not self.conn.alive:
+            raise RuntimeError("connection lost")
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        pass
+
+
+class StubConnection:
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+
+    def cursor(self):
+        return StubCursor(self)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    """Connections created by pyodbc.connect, in order."""
+    connections = []
+
+    def connect(connection_string):
+        conn = StubConnection()
+        connections.append(conn)
+        return conn
+
+    monkeypatch.setattr(MSSQLDatabase.pyodbc, "connect", connect)
+    return connections
+
+
+def test_released_connection_is_reused(opened):
+    pool = MSSQLConnectionPool("stub", max_size=2)
+    conn = pool.acquire()
+    pool.release(conn)
+
+    assert pool.acquire() is conn
+    assert len(opened) == 1
+    assert pool.stats()["hits"] == 1
+    assert pool.stats()["misses"] == 1
+
+
+def test_idle_connection_is_evicted(opened):
+    pool = MSSQLConnectionPool("stub", max_size=2, idle_timeout=0.0)
+    conn = pool.acquire()
+    pool.release(conn)
+
+    fresh = pool.acquire()
+    assert fresh is not conn
+    assert conn.closed
+    assert len(opened) == 2
+    assert pool.stats()["size"] == 1
+    assert pool.stats()["discarded"] == 1
+
+
+def test_checkout_times_out_when_pool_is_exhausted(opened):
+    pool = MSSQLConnectionPool("stub", max_size=1)
+    pool.acquire()
+
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire(timeout=0.05)
+    assert pool.stats()["waits"] == 1
+
+
+def test_broken_connection_is_replaced(opened):
+    pool = MSSQLConnectionPool("stub", max_size=1)
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.alive = False
+
+    fresh = pool.acquire()
+    assert fresh is not conn
+    assert conn.closed
+    assert pool.stats()["size"] == 1
+
+
+def test_liveness_check_runs_without_the_pool_lock(opened, monkeypatch):
+    pool = MSSQLConnectionPool("stub", max_size=1)
+    pool.release(pool.acquire())
+    lock_free = []
+
+    def is_alive(conn):
+        # another thread must be able to use the pool while the SELECT 1 is running
+        t = threading.Thread(target=lambda: lock_free.append(pool.stats()))
+        t.start()
+        t.join(timeout=1)
+        return True
+
+    monkeypatch.setattr(pool, "_is_alive", is_alive)
+    pool.acquire()
+    assert lock_free
@@ -0,0 +1,43 @@
+import datetime as dt
+import os
+
+from postmark_store import PostmarkStore, postmark_hash
+
+RECEIVER = "Andreas Scharf\nBachstraße 24-26\n96188 Stettfeld\nDeutschland"
+
+
+def test_postmark_store(tmp_path):
+    root = str(tmp_path)
+    legacy_key = postmark_hash("Altkunde\n96188 Stettfeld", "270", "2020-01-01")
+    with open(os.path.join(root, f"{legacy_key}.png"), "wb") as f:
+        f.write(b"legacy")
+
+    store = PostmarkStore(root)
+    assert store.get(RECEIVER, "270") is False
+    key = store.put(RECEIVER, "270", b"png", order_ref=4711, product_code=290, price=270, shop_order_id="1")
+    assert key == postmark_hash(RECEIVER, "270")
+    assert store.has(RECEIVER, "270") and store.get(RECEIVER, "270") == b"png"
+    assert os.path.exists(os.path.join(root, key[:2], f"{key}.png"))
+    assert store.info(key)["order_ref"] == "4711"
+
+    assert store.import_legacy() == 1
+    assert store.get_by_key(legacy_key) == b"legacy"
+    assert not os.path.exists(os.path.join(root, f"{legacy_key}.png"))
+
+    old = store.put(RECEIVER, "270", b"old", date=(dt.date.today() - dt.timedelta(days=4 * 365)).strftime('%Y-%m-%d'))
+    assert store.compact(retention_days=3 * 365) == 1
+    assert old not in store and key in store
+    assert not os.path.exists(store.blob_path(old))
+
+    assert key in PostmarkStore(root)  # the index survives a restart
+
+
+def test_postmark_store_sees_other_instances(tmp_path):
+    store = PostmarkStore(str(tmp_path))
+    other = PostmarkStore(str(tmp_path))  # e.g. a second instance of the application
+    version = store.version
+    key = other.put("Andreas Scharf\n96188 Stettfeld", "270", b"png")
+    assert key not in store
+    assert store.reload_if_changed()
+    assert key in store and store.version > version
+    assert not store.reload_if_changed()
@@ -0,0 +1,16 @@
+import os
+
+from render_cache import RenderCache
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    cache = RenderCache(max_bytes=0, disk_dir=str(tmp_path), disk_max_bytes=3500)
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.put(key, b"x" * 1000)
+        os.utime(tmp_path / f"{key}.pdf", (i, i))
+
+    assert cache.get("a") == b"x" * 1000  # touched, "b" is the oldest now
+    cache.put("d", b"x" * 1000)
+
+    assert sorted(os.listdir(tmp_path)) == ["a.pdf", "c.pdf", "d.pdf"]
+    assert cache.get("b") is None
@@ -1,10 +1,14 @@
-import os
-import hashlib
-import datetime as _dt
 import tkinter as tk
 from tkinter import ttk
 from tkinter import font as tkfont
 
+from address import Address
+from dhl_api import struct_address
+from postmark_store import postmark_hash
+
+# typing pauses this long (ms) before the 'gekauft' status is checked
+STATUS_DEBOUNCE_MS = 300
+
 
 class StatusKnob(ttk.Frame):
     """Small colored circle: set(True) -> green, set(False) -> red, set(None) -> gray."""
@@ -32,11 +36,14 @@ class TextRow(ttk.Frame):
     """
     A labeled multi-line text editor with footer:
       - Internetmarke combobox (vertical)
-      - 'gekauft' status knob (auto-updates on text change)
+      - 'gekauft' status knob (auto-updates on text / Internetmarke change,
+        looked up in the postmark store set with set_postmark_store())
     """
     def __init__(self, master, title="Section", **kw):
         super().__init__(master, **kw)
-        self._purchase_dir = "purchases"  # folder where <hash>.pdf is expected
+        self._postmark_store = None  # postmark_store.PostmarkStore
+        self._address = None          # Address set with set_address(), valid while the text is unchanged
+        self._status_after_id = None
 
         # ---- Header ----
       
@@ -81,6 +88,8 @@ class TextRow(ttk.Frame):
             values=["-"],
         )
         self._marke_cb.pack(side="left")
+        # also fires for programmatic changes (auto_select_internetmarke_for_country)
+        self._marke_var.trace_add("write", lambda *_: self.schedule_purchase_check())
 
         # Row 2: gekauft label + knob
         row2 = ttk.Frame(footer)
@@ -92,6 +101,8 @@ class TextRow(ttk.Frame):
 
         # cache of combobox options
         self._marke_options: list[str] = ["-"]
+        self._marke_text_to_val = {"-": "-"}
+        self._marke_val_to_text = {"-": "-"}
 
     # ---------- Address text ----------
     def set_text(self, value: str):
@@ -103,6 +114,17 @@ class TextRow(ttk.Frame):
     def get_text(self) -> str:
         return self.text.get("1.0", "end-1c")
 
+    def set_address(self, address: Address):
+        """Show a structured address (e.g. from the JTL import), get_address() returns it as it is."""
+        self.set_text(address.text)
+        self._address = address
+
+    def get_address(self) -> Address:
+        """The structured address, parsed from the text only if it was typed or edited."""
+        if self._address is not None and self._address.text == self.get_text():
+            return self._address
+        return struct_address(self.get_text())
+
    # ---------- Internetmarke ----------
     def set_internetmarke_options(self, options: list[tuple[str, str]]):
         """
@@ -170,28 +192,33 @@ class TextRow(ttk.Frame):
 
 
     # ---------- gekauft status ----------
-    def set_purchase_dir(self, path: str):
-        self._purchase_dir = path
-
-    def compute_purchase_hash(self, date_iso: str | None = None) -> str:
-        if not date_iso:
-            date_iso = _dt.date.today().isoformat()
-        key = (self.get_text().strip() + "\n" + date_iso).encode("utf-8")
-        return hashlib.md5(key).hexdigest()
+    def set_postmark_store(self, store):
+        self._postmark_store = store
+        self.check_purchase_status()
 
-    def expected_purchase_path(self, ext: str = ".pdf", date_iso: str | None = None) -> str:
-        h = self.compute_purchase_hash(date_iso=date_iso)
-        return os.path.join(self._purchase_dir, f"{h}{ext}")
+    def compute_purchase_hash(self, date_iso: str | None = None) -> str | None:
+        """Key of the postmark for the current text / Internetmarke, same as window._print_pdf_blob stores it."""
+        product_id = self.get_internetmarke()
+        if not product_id:
+            return None
+        return postmark_hash(self.get_text(), product_id, date_iso)
 
     def check_purchase_status(self, date_iso: str | None = None) -> bool | None:
-        path = self.expected_purchase_path(date_iso=date_iso)
-        exists = os.path.exists(path)
-        self._gekauft_knob.set(True if exists else None)
-        return True if exists else None
+        self._status_after_id = None
+        key = self.compute_purchase_hash(date_iso=date_iso)
+        bought = self._postmark_store is not None and key is not None and key in self._postmark_store
+        self._gekauft_knob.set(True if bought else None)
+        return True if bought else None
+
+    def schedule_purchase_check(self, delay_ms: int = STATUS_DEBOUNCE_MS):
+        """Check the status once typing paused for `delay_ms`."""
+        if self._status_after_id is not None:
+            self.after_cancel(self._status_after_id)
+        self._status_after_id = self.after(delay_ms, self.check_purchase_status)
 
     # ---------- event handlers ----------
     def _on_text_change(self, event=None):
         if event:
             # reset modified flag
             self.text.edit_modified(False)
-        self.check_purchase_status()
+        self.schedule_purchase_check()
@@ -1,15 +1,18 @@
 # tk_tabs.py
-from io import BytesIO
-import json
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
 
+import queue
 import threading
+from concurrent.futures import ThreadPoolExecutor
 
-from dhl_api import api_version_resource, checkout_shopping_chart_png, download_and_unpack, get_shopping_chart_id, struct_address, user_resource
+from dhl_api import checkout_shopping_chart_png, download_postmarks, get_shopping_chart_id, struct_address
+from dhl_async import AsyncDHLClient, AsyncLoopThread
+from dhl_bulk import purchase_bulk, quote
+from postmark_store import PostmarkStore, postmark_hash
+from address import Address
 
-from utils import asset_path   # <-- import the class, not the module
 # window.py
 from MSSQLDatabase import MSSQLDatabase
 
@@ -18,7 +21,7 @@ class App(tk.Tk):
         super().__init__()
         ...
         # correct way to get a db instance:
-        with MSSQLDatabase.connect_with_env() as db:
+        with MSSQLDatabase.pooled_with_env() as db:
             # e.g. test connection or store it
             print("Connected OK")
 
@@ -28,25 +31,172 @@ from a4_a6_selector import A4A6Selector
 import tkinter as tk
 from tkinter import ttk
 
-from jtl_api import fetch_orders
-from prepare_print_pdf import prepare_pdf_blob
+from jtl_api import OrderQueue
+from jtl_mirror import MirrorRefresher, OrderMirror
+from prepare_print_pdf import (
+    debug_html_enabled, prepare_pdf_batch_blob, prepare_pdf_blob, render_workers, set_debug_html,
+)
 from text_row import TextRow, StatusKnob
 import os
-import datetime as dt
-import hashlib
 
 
 INTERNETMARKEN_PRODUCTS = [('290', 'Warensendung', 270), ('331', 'Warensendung 1.000 zzgl. Gewichtszuschlag', 355)]
+# combobox (value, text) per product, same order as INTERNETMARKEN_PRODUCTS
+INTERNETMARKEN_OPTIONS = [('270', 'Warensendung'), ('331', 'Warensendung 1.000 zzgl. Gewichtszuschlag')]
+
+def bulk_settings() -> dict:
+    """Bulk purchase: positions per DHL cart and carts checked out at the same time (read on use, after .env is loaded)."""
+    return {
+        "max_cart_size": int(os.getenv("DHL_BULK_CART_SIZE", 20)),
+        "max_concurrency": int(os.getenv("DHL_BULK_CONCURRENCY", 3)),
+    }
+
+# how often (ms) the 'gekauft' knobs look for changes of the postmark store
+POSTMARK_KNOB_POLL_MS = 500
 A4_W, A4_H = 210, 297  # DIN A4 aspect ratio
 
-MARKS_PATH = 'marks'
+def stored_postmark(receiver, product_id):
+    """Return the PNG bytes of a postmark bought today for this receiver, False if there is none."""
+    return PostmarkStore.default().get(receiver, product_id)
 
-def marks_dictionary():
-    if not os.path.exists(asset_path(MARKS_PATH)):
-        os.makedirs(asset_path(MARKS_PATH))
+def default_internetmarke(address):
+    """Internetmarke value which TextRow.auto_select_internetmarke_for_country() would pick (Address or text)."""
+    country = address.country if isinstance(address, Address) else struct_address(address).country
+    if country.strip().upper() in ("DE", "DEU", "GERMANY", "DEUTSCHLAND"):
+        return '270'
+    return None
+
+def internetmarke_product(value):
+    """(product_code, text, price) of a combobox value, None for '-' / unknown."""
+    for index, (option_value, _) in enumerate(INTERNETMARKEN_OPTIONS):
+        if option_value == value:
+            return INTERNETMARKEN_PRODUCTS[index]
+    return None
 
 class UserCancelledError(Exception): pass
 
+class JobCancelledError(Exception): pass
+
+class Job:
+    """Handle passed to background work: progress reporting and cooperative cancellation."""
+    def __init__(self, name, runner):
+        self.name = name
+        self._runner = runner
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def check_cancelled(self):
+        """Call between steps, raises JobCancelledError once cancel() was requested."""
+        if self._cancel.is_set():
+            raise JobCancelledError(f"{self.name} cancelled")
+
+    def progress(self, text):
+        self._runner._events.put(("progress", self, text, None))
+
+class JobRunner:
+    """
+    Runs work(job) callables in background threads. Results, errors and progress
+    are put on a queue which is polled with after(), so all callbacks run on the
+    Tk main thread and may touch widgets.
+    """
+    def __init__(self, root, on_status=None, on_busy=None, max_workers=2, poll_ms=100):
+        self._root = root
+        self._on_status = on_status or (lambda text: None)
+        self._on_busy = on_busy or (lambda busy: None)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._events = queue.Queue()
+        self._jobs = {}  # name -> running Job
+        self._poll_ms = poll_ms
+        self._polling = False
+
+    def is_running(self, name) -> bool:
+        return name in self._jobs
+
+    def submit(self, name, work, on_done=None, on_error=None) -> Job | None:
+        """Start work(job) unless a job with the same name is still running."""
+        if name in self._jobs:
+            self._on_status(f"{name} läuft bereits ...")
+            return None
+        job = Job(name, self)
+        self._jobs[name] = job
+
+        def run():
+            try:
+                result = work(job)
+                job.check_cancelled()
+                self._events.put(("done", job, result, on_done))
+            except JobCancelledError:
+                self._events.put(("cancelled", job, None, None))
+            except Exception as e:
+                self._events.put(("error", job, e, on_error))
+
+        self._executor.submit(run)
+        self._on_busy(True)
+        if not self._polling:
+            self._polling = True
+            self._root.after(self._poll_ms, self._poll)
+        return job
+
+    def cancel_all(self):
+        for job in self._jobs.values():
+            job.cancel()
+        if self._jobs:
+            self._on_status("Abbrechen ...")
+
+    def _poll(self):
+        try:
+            self._deliver_events()
+        finally:
+            # always poll again while jobs run, a failing callback must not stop the delivery
+            if self._jobs:
+                self._root.after(self._poll_ms, self._poll)
+            else:
+                self._polling = False
+                self._on_busy(False)
+
+    def _deliver_events(self):
+        while True:
+            try:
+                kind, job, value, callback = self._events.get_nowait()
+            except queue.Empty:
+                break
+
+            if kind == "progress":
+                self._on_status(value)
+                continue
+
+            self._jobs.pop(job.name, None)
+            if kind == "done":
+                self._on_status("")
+                if callback:
+                    self._run_callback(job, callback, value)
+            elif kind == "cancelled":
+                self._on_status(f"{job.name}: abgebrochen")
+            else:
+                print(f"Job {job.name} failed: {value}")
+                self._on_status(f"{job.name}: Fehler")
+                self._run_callback(job, callback or self._show_error(job), value)
+
+    def _run_callback(self, job, callback, value):
+        try:
+            callback(value)
+        except Exception as e:
+            print(f"Job {job.name}: callback failed: {e}")
+            self._on_status(f"{job.name}: Fehler")
+            try:
+                self._show_error(job)(e)
+            except tk.TclError:
+                pass
+
+    def _show_error(self, job):
+        """Default on_error: show the cause to the operator, not only in the status bar."""
+        return lambda e: messagebox.showerror(job.name, f"{job.name} fehlgeschlagen:\n{e}", parent=self._root)
+
 def ok_cancel_dialog(title="Confirm", message="Proceed?"):
     root = tk.Tk()
     root.withdraw()               # hide root window
@@ -134,8 +284,27 @@ class App(tk.Tk):
                 background=[("active", "#1565C0")])  # darker blue when pressed
         btn_print = ttk.Button(footer, text="Drucken", command=self._print_pdf_blob)
 
-        btn_preview.grid(row=0, column=1, sticky="e", padx=(0, 6))
-        btn_print.grid(row=0, column=2, sticky="e")
+        # one multi page PDF for all open orders
+        btn_print_all = ttk.Button(footer, text="Alle offenen drucken", command=self._on_print_all_open)
+
+        btn_print_all.grid(row=0, column=1, sticky="e", padx=(0, 6))
+        btn_preview.grid(row=0, column=2, sticky="e", padx=(0, 6))
+        btn_print.grid(row=0, column=3, sticky="e")
+
+        # Status row: background jobs (import, purchase, rendering)
+        status_bar = ttk.Frame(footer)
+        status_bar.grid(row=1, column=0, columnspan=4, sticky="ew", pady=(6, 0))
+        status_bar.columnconfigure(0, weight=1)
+
+        self.var_status = tk.StringVar(value="")
+        ttk.Label(status_bar, textvariable=self.var_status, anchor="w").grid(row=0, column=0, sticky="ew")
+        self.progress = ttk.Progressbar(status_bar, mode="indeterminate", length=120)
+        self.progress.grid(row=0, column=1, padx=(6, 6))
+        self.btn_cancel = ttk.Button(status_bar, text="Abbrechen", state="disabled",
+                                     command=lambda: self.jobs.cancel_all())
+        self.btn_cancel.grid(row=0, column=2)
+
+        self.jobs = JobRunner(self, on_status=self.var_status.set, on_busy=self._set_busy)
 
 
 
@@ -177,6 +346,17 @@ class App(tk.Tk):
                                     textvariable=self.var_days, justify="right")
         self.spin_days.pack(side="left")
 
+        # cursor over the open orders, hands out the next unprinted page on every import
+        self.order_queue = OrderQueue(days=int(self.var_days.get()))
+        self._cell_orders = {}  # cell -> (kAuftrag, imported address)
+
+        # optional local SQLite mirror, kept up to date in the background
+        self.var_use_mirror = tk.BooleanVar(value=os.getenv("JTL_MIRROR", "0") == "1")
+        ttk.Checkbutton(lf_query, text="Lokaler JTL Cache (SQLite)",
+                        variable=self.var_use_mirror).pack(anchor="w", pady=(0, 6))
+        self.order_mirror = None
+        self.mirror_refresher = None
+
         # Group: JTL Database
         lf_jtl = ttk.LabelFrame(settings, text="JTL Database")
         lf_jtl.pack(fill="x", pady=(10, 0))
@@ -217,17 +397,46 @@ class App(tk.Tk):
 
         ttk.Label(info, textvariable=self.var_wallet).pack(anchor="w")
         ttk.Label(info, textvariable=self.var_issued).pack(anchor="w")
+        # Group: Debug
+        lf_debug = ttk.LabelFrame(settings, text="Debug")
+        lf_debug.pack(fill="x", pady=(0, 10))
+
+        self.var_debug_html = tk.BooleanVar(value=debug_html_enabled())
+        ttk.Checkbutton(lf_debug, text="Label HTML in assets/tmp.html speichern",
+                        variable=self.var_debug_html,
+                        command=lambda: set_debug_html(self.var_debug_html.get())).pack(anchor="w", padx=6, pady=4)
+
         # ---- Notes page ----
         history = ttk.Frame(nb, padding=12)
         nb.add(history, text="History")
         tk.Text(history, height=12).pack(fill="both", expand=True)
 
 
+        # asyncio Internetmarke client on its own event loop thread
+        self.dhl_loop = AsyncLoopThread()
+        self.dhl_async = AsyncDHLClient()
+
         self._on_test_portokasse()
 
         self.set_internetmarke_options()
-        
-        marks_dictionary()
+
+        self.postmarks = PostmarkStore.default()
+        self.jobs.submit("Postmarken aufräumen", self._maintain_postmarks)
+        for row in self.rows.values():
+            row.set_postmark_store(self.postmarks)
+        # the index is reloaded when another instance buys postmarks, the knobs follow every change
+        self.postmarks.watch(interval=float(os.getenv("POSTMARK_POLL_INTERVAL", 2)))
+        self._postmarks_version = self.postmarks.version
+        self.after(POSTMARK_KNOB_POLL_MS, self._poll_postmarks)
+
+        # start the render processes once the window is up, so the first large batch
+        # does not pay for the weasyprint import and template compile in every worker
+        if render_workers() > 1:
+            self.after_idle(self._warm_up_render_pool)
+
+    def _warm_up_render_pool(self):
+        from render_pool import warm_up_pool
+        warm_up_pool()
 
     def _center(self, w, h):
         self.update_idletasks()
@@ -239,157 +448,323 @@ class App(tk.Tk):
         names = [self.selector.cell_names[i] for i in selected]
         self.status.set("Selected: " + (", ".join(names) if names else "none"))
 
-    def _on_import_jtl(self):
-        # Start by entering a MSSQL Connection from .env
-
-        with MSSQLDatabase.connect_with_env() as db:
-
-            # Fetch the latest orders without ShipmentQuote
-            data = fetch_orders(db, days=30)
+    def _set_busy(self, busy):
+        if busy:
+            self.progress.start(15)
+            self.btn_cancel.state(["!disabled"])
+        else:
+            self.progress.stop()
+            self.btn_cancel.state(["disabled"])
 
+    def _on_import_jtl(self):
+        days = int(self.var_days.get())
+        selected = self.selector.get_selected()
+        use_mirror = self.var_use_mirror.get()
+        # skip printed orders and the ones already shown, so every click hands out the next page
+        exclude = self.order_queue.consumed_keys() | {k for k, _ in self._cell_orders.values()}
+
+        def work(job):
+            job.progress("Lade Bestellungen aus JTL ...")
+            if use_mirror:
+                return self._orders_from_mirror(days, len(selected), exclude)
+
+            # Borrow a MSSQL Connection from the pool (configured from .env)
+            with MSSQLDatabase.pooled_with_env() as db:
+                # Fetch only the next unprinted orders without ShipmentQuote, one per selected box
+                return self.order_queue.next_page(db, len(selected), days=days)
+
+        def done(page):
             # Display the addresses in the selected boxes
-            for index, c in enumerate(self.selector.get_selected()):
-                if len(data) > index:
-                    self.rows[c].set_text(data[index])
-
-                    # check if the data is in Germany
-                    name, addiditional_name, street, street2, postalcode, city, country = struct_address(self.rows[c].get_text())
-                    self.rows[c].auto_select_internetmarke_for_country(country)
-
-
+            for c, (k_auftrag, address) in zip(selected, page):
+                # the structured address goes with the text, it is only parsed again if the text is edited
+                self.rows[c].set_address(address)
+                self._cell_orders[c] = (k_auftrag, address.text)
+
+                # check if the data is in Germany
+                self.rows[c].auto_select_internetmarke_for_country(address.country)
+            self.var_status.set(f"{len(page)} Adressen importiert")
+
+        self.jobs.submit("Import", work, done)
+
+    def _mark_printed(self, cells):
+        """Mark the JTL orders shown in the given cells as consumed, unless the text was replaced."""
+        printed = []
+        for c in cells:
+            k_auftrag, address = self._cell_orders.pop(c, (None, None))
+            if k_auftrag is not None and self.rows[c].get_text() == address:
+                printed.append(k_auftrag)
+        self.order_queue.mark_consumed(printed)
+
+    def _cell_order_ref(self, cell, text):
+        """kAuftrag of the imported order in this cell, None if the cell was typed or edited."""
+        k_auftrag, address = self._cell_orders.get(cell, (None, None))
+        return k_auftrag if address == text else None
+
+    def _orders_from_mirror(self, days, size, exclude=()) -> list[tuple[int, Address]]:
+        """
+        Read open orders from the local SQLite mirror, MSSQL is only touched by the background refresher.
+        Runs in a background job.
+        """
+        if self.order_mirror is None:
+            self.order_mirror = OrderMirror()
+            self.mirror_refresher = MirrorRefresher(
+                self.order_mirror, days=days, interval=float(os.getenv("JTL_MIRROR_INTERVAL", 60))
+            )
 
+        # first use or a larger "Tage" window: load the whole window before reading the mirror
+        if not self.order_mirror.covers(days):
+            with MSSQLDatabase.pooled_with_env() as db:
+                self.order_mirror.sync(db, days=days)
 
+        if days > self.mirror_refresher.days:
+            self.mirror_refresher.days = days
+        self.mirror_refresher.start()
 
-    def _load_pdf_blob(self, path: str) -> bytes:
+        return self.order_mirror.open_orders(days=days, limit=size, exclude=exclude)
 
+    def _selected_receivers(self) -> list:
+        """Receiver text per slot for the selected cells, False for the others."""
         data = [False, False, False, False]
-        poststamp = [False, False, False, False]
-
-        dhl_positions = []
         for c in self.selector.get_selected():
             # set text for pdf preparation
-            text = self.rows[c].get_text()
-            data[c] = text
-
-            p = self.rows[c].get_internetmarke() 
-            if p != '-':
-                poststamp[c] = p
-
-                
-
-        return prepare_pdf_blob(send_addr=os.getenv("SENDER_ADDR"), data=data, postmarks=[False, False, False, False])
-        
-
-    def _print_pdf_blob(self, ) -> bytes:
-        data = [False, False, False, False]
+            data[c] = self.rows[c].get_text()
+        return data
+
+    def _poll_postmarks(self):
+        if self.postmarks.version != self._postmarks_version:
+            self._postmarks_version = self.postmarks.version
+            for row in self.rows.values():
+                row.check_purchase_status()
+        self.after(POSTMARK_KNOB_POLL_MS, self._poll_postmarks)
+
+    def _maintain_postmarks(self, job):
+        """Move postmarks of older versions into the store and drop expired ones."""
+        self.postmarks.import_legacy()
+        self.postmarks.compact()
+
+    def _store_postmark(self, position, png, shop_order_id):
+        self.postmarks.put(
+            position['receiver'], position['product_id'], png,
+            order_ref=position.get('order_ref'), product_code=position['product_code'],
+            price=position['price'], shop_order_id=shop_order_id,
+        )
+
+    def _print_pdf_blob(self, ):
+        selected = self.selector.get_selected()
+        data = self._selected_receivers()
         postmark = [False, False, False, False]
 
         dhl_positions = []
 
-        # build receiver blocks
-        for c in self.selector.get_selected():
-            # set text for pdf preparation
-            text = self.rows[c].get_text()
-            data[c] = text
-
+        # check for existing postmarks
+        # path must be at -> ./marks/md5({'receiver': '', 'product_id': '270', 'date': '2025-09-05'}).png
+        for c in selected:
+            text = data[c]
             p = self.rows[c].get_internetmarke() 
             if p:
-                postmark_position = { "receiver": text, "product_id": p, "date": dt.datetime.today().strftime('%Y-%m-%d') }
-
-                hash = hashlib.md5(json.dumps(postmark_position).encode('utf-8')).hexdigest()
-                
-                mark_path = asset_path(f"./marks/{hash}.png")
-                # file exists and if open and add to postmarks
-                if os.path.exists(mark_path):
-                    with open(mark_path, 'rb') as f:
-                        postmark[c] = f.read() 
-                # file does not exist 
+                stored = stored_postmark(text, p)
+                # file exists, add to postmarks
+                if stored:
+                    postmark[c] = stored
+                # file does not exist, append to dhl_positions
                 else:
-                    postmark_position['hash'] = hash
-                    postmark_position['index'] = c
-                    # append to dhl_positions
-                    dhl_positions.append(postmark_position)
-
-      
+                    index = self.rows[c].get_internetmarke_index() - 1
+                    dhl_positions.append({
+                        "receiver": text,
+                        "address": self.rows[c].get_address(),
+                        "product_id": p,
+                        "hash": postmark_hash(text, p),
+                        "index": c,
+                        "order_ref": self._cell_order_ref(c, text),
+                        "price": INTERNETMARKEN_PRODUCTS[index][2],
+                        "product_code": INTERNETMARKEN_PRODUCTS[index][0],
+                    })
 
         # need to purchase new postmarks
         if len(dhl_positions):
-            total_price = 0
+            total_price = sum(e['price'] for e in dhl_positions) / 100
             addresses = '\n'.join(map(lambda e: e['receiver'] if e else '', dhl_positions))
             
             message = f"""
-                Möchtest du bei DHL {len(dhl_positions)} Marken für {total_price} kaufen?
+                Möchtest du bei DHL {len(dhl_positions)} Marken für {total_price:.2f} € kaufen?
                 {addresses}
             """ 
             
-            ok_cancel_dialog(title='kostenpflichtig Kaufen?', message=message)
-
-            access_token, walletBalance, token_type, expires_in, issued_at, external_customer_id, authenticated_user = user_resource()
-            # create a shopping chart with id
-            shop_order_id = get_shopping_chart_id()
-
-            def internetmark_position(c):
-                e = self.rows[c]
-                index = e.get_internetmarke_index() 
-                if index:
-                    index = index - 1
-                    return  { "receiver": e.get_text(), "price": INTERNETMARKEN_PRODUCTS[index][2], "product_code": INTERNETMARKEN_PRODUCTS[index][0] }
-                else:
-                    return False
-                
-            images = []
-            response = 0
             try:
-                response = checkout_shopping_chart_png(shop_order_id, list(filter(lambda e: e, list(map(internetmark_position , self.rows)))))
-                images = download_and_unpack(response['link'])
-            except:
-                print(response)
-                ok_cancel_dialog('Fehler beim Postmarken kauf', json.loads(response)['description'])
-                pass
-
-            for index in range(len(dhl_positions)):
-                postmark_index = dhl_positions[index]['index']
-                
-                # convert python png to buffer 
-                buf = BytesIO()
-                images[index].save(buf, format='PNG')               # encode to PNG/JPEG/etc.
-                img_data = buf.getvalue()   
-
-                # convert image to postmark
-                postmark[postmark_index] = img_data
-
-                img_path = asset_path(f"./marks/{hash}.png")
-
-                # save image as binary
-                with open(img_path, 'wb') as f:
-
-                    f.write(img_data)
-    
-
-        
-
-        pdf_blob = prepare_pdf_blob(send_addr=os.getenv("SENDER_ADDR"), data=data, postmarks=postmark )
-
-        # check for existing postmarks
-        # path must be at -> ./marks/md5({'receiver': '', 'product_id': '270', 'date': '2025-09-05'}).png
-           
-        # open preview window
-        # Show the preview + settings window
-        from printer import show_pdf_preview_toplevel
-        viewer, win = show_pdf_preview_toplevel(self, pdf_blob=pdf_blob, title="Mein PDF Druck")
-
-
-
-
+                ok_cancel_dialog(title='kostenpflichtig Kaufen?', message=message)
+            except UserCancelledError:
+                return
+
+        def work(job):
+            if dhl_positions:
+                job.progress(f"Kaufe {len(dhl_positions)} Postmarken bei DHL ...")
+                job.check_cancelled()
+                # create a shopping chart with id (the cached DHL token is reused)
+                shop_order_id = get_shopping_chart_id()
+
+                # last chance to cancel, after the checkout the postmarks are paid
+                job.check_cancelled()
+                response = checkout_shopping_chart_png(shop_order_id, dhl_positions)
+                if 'link' not in response:
+                    raise Exception(response.get('description', response))
+
+                job.progress("Lade Postmarken herunter ...")
+                postmarks = download_postmarks(response['link'])
+                if len(postmarks) != len(dhl_positions):
+                    raise Exception(f"{len(postmarks)} Postmarken für {len(dhl_positions)} Positionen erhalten")
+
+                for position, (name, img_data) in zip(dhl_positions, postmarks):
+                    postmark[position['index']] = img_data
+                    self._store_postmark(position, img_data, shop_order_id)
+
+            job.check_cancelled()
+            job.progress("Erstelle PDF ...")
+            return prepare_pdf_blob(send_addr=os.getenv("SENDER_ADDR"), data=data, postmarks=postmark )
+
+        def done(pdf_blob):
+            self._mark_printed(selected)
+
+            # open preview window
+            # Show the preview + settings window
+            from printer import show_pdf_preview_toplevel
+            viewer, win = show_pdf_preview_toplevel(self, pdf_blob=pdf_blob, title="Mein PDF Druck")
+
+        def failed(e):
+            messagebox.showerror('Fehler beim Postmarken kauf', str(e), parent=self)
+
+        self.jobs.submit("Drucken", work, done, failed)
+
+    def _on_print_all_open(self):
+        """Render all open, not yet printed orders 4 per page into one PDF and open the print window."""
+        days = int(self.var_days.get())
+        use_mirror = self.var_use_mirror.get()
+        exclude = self.order_queue.consumed_keys()
+
+        def fetch(job):
+            job.progress("Lade offene Bestellungen ...")
+            if use_mirror:
+                return self._orders_from_mirror(days, None, exclude)
+            with MSSQLDatabase.pooled_with_env() as db:
+                return self.order_queue.remaining(db, days=days)
+
+        def fetched(orders):
+            if not orders:
+                messagebox.showinfo("Alle offenen drucken", "Keine offenen Bestellungen gefunden.")
+                return
+
+            def prepare(job):
+                # reuse postmarks bought today, collect the missing ones for a bulk purchase
+                receivers = [address.text for _, address in orders]
+                postmarks = []
+                missing = []
+                for i, (k_auftrag, address) in enumerate(orders):
+                    text = receivers[i]
+                    p = default_internetmarke(address)
+                    stored = stored_postmark(text, p)
+                    postmarks.append(stored)
+                    product = internetmarke_product(p)
+                    if p and not stored and product:
+                        missing.append({
+                            "receiver": text, "address": address, "product_id": p, "hash": postmark_hash(text, p),
+                            "index": i, "order_ref": k_auftrag,
+                            "product_code": product[0], "price": product[2],
+                        })
+                job.progress("Prüfe Portokasse ...")
+                return receivers, postmarks, missing, (quote(missing) if missing else None)
+
+            self.jobs.submit(
+                "Alle drucken", prepare,
+                lambda result: self._confirm_print_all(orders, *result),
+                lambda e: messagebox.showerror("Portokasse", str(e), parent=self),
+            )
+
+        self.jobs.submit("Offene Bestellungen", fetch, fetched)
+
+    def _confirm_print_all(self, orders, receivers, postmarks, missing, cost):
+        message = f"{len(orders)} offene Bestellungen auf {-(-len(orders) // 4)} Seiten drucken?"
+        if missing:
+            message += (f"\n\n{len(missing)} Postmarken für {cost['total'] / 100:.2f} € kaufen"
+                        f" (Portokasse: {cost['wallet'] / 100:.2f} €)?")
+            if not cost['sufficient']:
+                messagebox.showerror("Alle offenen drucken", message + "\n\nDas Guthaben reicht nicht aus.")
+                return
+        try:
+            ok_cancel_dialog(title='Alle offenen drucken?', message=message)
+        except UserCancelledError:
+            return
+
+        def work(job):
+            results = []
+            if missing:
+                job.check_cancelled()
+                job.progress(f"Kaufe {len(missing)} Postmarken bei DHL ...")
+                results = purchase_bulk(
+                    missing, loop_thread=self.dhl_loop, **bulk_settings(),
+                    on_progress=lambda done, total: job.progress(f"DHL Warenkorb {done} / {total} gekauft ..."),
+                )
+                for result in results:
+                    if result["png"]:
+                        position = result["position"]
+                        postmarks[position["index"]] = result["png"]
+                        self._store_postmark(position, result["png"], result["shopOrderId"])
+
+            # orders whose purchase failed are not printed without a stamp, they stay open
+            failed_index = {r["position"]["index"] for r in results if r["error"]}
+            printed = [i for i in range(len(orders)) if i not in failed_index]
+            pdf_blob = None
+            if printed:
+                job.progress(f"Erstelle PDF mit {len(printed)} Etiketten ...")
+                pdf_blob = prepare_pdf_batch_blob(
+                    send_addr=os.getenv("SENDER_ADDR"),
+                    receivers=[receivers[i] for i in printed], postmarks=[postmarks[i] for i in printed],
+                )
+            return pdf_blob, results, printed
+
+        def done(result):
+            pdf_blob, results, printed = result
+            # every printed label is done (as in _mark_printed), also the ones which need
+            # no postmark (abroad), only the orders whose purchase failed come back
+            self.order_queue.mark_consumed(orders[i][0] for i in printed)
+
+            failed = [r for r in results if r["error"]]
+            if failed:
+                details = "\n".join(
+                    f"{r['position'].get('order_ref')}  {r['position']['receiver'].splitlines()[0]}: {r['error']}"
+                    for r in failed[:10]
+                )
+                more = f"\n... und {len(failed) - 10} weitere" if len(failed) > 10 else ""
+                charged = sorted({r["shopOrderId"] for r in failed if r["possibly_charged"]})
+                warning = (f"\n\nMöglicherweise bezahlt, vor einem neuen Kauf im Portokasse-Konto prüfen: "
+                           f"Warenkorb {', '.join(charged)}" if charged else "")
+                messagebox.showwarning(
+                    "Postmarken",
+                    f"{len(results) - len(failed)} gekauft, {len(failed)} fehlgeschlagen.\n"
+                    f"Diese Bestellungen werden nicht gedruckt und bleiben offen:\n{details}{more}{warning}",
+                )
+
+            if pdf_blob is None:
+                return
+            from printer import show_pdf_preview_toplevel
+            show_pdf_preview_toplevel(self, pdf_blob=pdf_blob, title="Alle offenen Bestellungen")
+
+        def failed(e):
+            messagebox.showerror('Fehler beim Postmarken kauf', str(e), parent=self)
+
+        self.jobs.submit("Alle drucken", work, done, failed)
 
     def _on_preview_pdf(self):
+        data = self._selected_receivers()
 
-        # TODO: replace with your real PDF bytes (from your generator or API)
-        pdf_blob = self._load_pdf_blob("output.pdf")  # ← any PDF file for testing
+        def work(job):
+            job.progress("Erstelle Vorschau ...")
+            return prepare_pdf_blob(send_addr=os.getenv("SENDER_ADDR"), data=data, postmarks=[False, False, False, False])
 
-        # open preview window
-        from pdf_preview import show_pdf_preview_toplevel  # or adjust import
-        show_pdf_preview_toplevel(self, pdf_blob=pdf_blob, title="Label-Vorschau")
+        def done(pdf_blob):
+            # open preview window
+            from pdf_preview import show_pdf_preview_toplevel  # or adjust import
+            show_pdf_preview_toplevel(self, pdf_blob=pdf_blob, title="Label-Vorschau")
+
+        self.jobs.submit("Vorschau", work, done)
 
     def get_lieferung_query(self) -> dict:
         """Read current Lieferung Query settings."""
@@ -410,25 +785,27 @@ class App(tk.Tk):
 
     def set_internetmarke_options(self):
         for i in range(0, len(self.rows)):
-            self.rows[i].set_internetmarke_options([('270', 'Warensendung'), ('331', 'Warensendung 1.000 zzgl. Gewichtszuschlag')])
+            self.rows[i].set_internetmarke_options(INTERNETMARKEN_OPTIONS)
 
     def _on_test_portokasse(self):
-        """Run Portokasse health check in a thread and update knob."""
+        """Run Portokasse health check in a background job and update knob."""
         # Optional: set to grey while checking
         self.porto_knob.set(None)
 
-        def work():
-            ok = api_version_resource()
-            access_token, walletBalance, token_type, expires_in, issued_at, external_customer_id, authenticated_user = user_resource()
-            self.after(0, lambda: self.porto_knob.set(True if ok else False))
+        def work(job):
+            # version check and authentication run concurrently on the asyncio thread
+            ok, user = self.dhl_loop.run(self.dhl_async.health_check())
+            return ok, user['walletBalance'], user['issued_at']
 
-            euro = walletBalance / 100
-            self.after(0, self.var_wallet.set(f"Wallet: {euro:.2f} €"))
-        
-            self.after(0, self.var_issued.set(f"Issued: {issued_at}"))
+        def done(result):
+            ok, walletBalance, issued_at = result
+            self.porto_knob.set(True if ok else False)
 
+            euro = walletBalance / 100
+            self.var_wallet.set(f"Wallet: {euro:.2f} €")
+            self.var_issued.set(f"Issued: {issued_at}")
 
-        threading.Thread(target=work, daemon=True).start()
+        self.jobs.submit("Portokasse", work, done, lambda e: self.porto_knob.set(False))
 
     def _check_portokasse_api(self) -> bool:
         """